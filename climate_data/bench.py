@@ -0,0 +1,216 @@
+#!/usr/bin/env python3.10
+"""Benchmark suite for the climate_data query pipeline on synthetic history.
+
+Every query runs in a fresh process so peak RSS is its own. Results are
+written as JSON so runs from different commits can be compared.
+"""
+
+import argparse
+import datetime as dt
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Iterable
+from typing import Any, NamedTuple
+
+import climate_data as cd
+
+START = dt.datetime(2023, 1, 1, 0, 0, 0, 123456)
+
+
+class Query(NamedTuple):
+    name: str
+    place: str
+    var: str
+    hours: tuple[dt.time, dt.time]
+    days: tuple[int, int] | None = None  # offset of --from/--to from START
+
+
+# A fixed set so numbers stay comparable between commits
+QUERIES = (
+    Query('default', 'Spikersuppa', 'temperature', (dt.time(12), dt.time(13))),
+    Query('all_day', 'Smestad', 'wind_speed', (dt.time(0), dt.time(23))),
+    Query('one_week', 'Alnabru', 'humidity', (dt.time(0), dt.time(23)), (30, 37)),
+    Query('one_month_noon', 'Brynbanen', 'cloud', (dt.time(12), dt.time(13)), (60, 90)),
+)
+
+
+def generate(path: str, days: int, step: dt.timedelta, seed: int = 0) -> int:
+    """Write `days` of NDJSON history in the layout `--fetch` produces."""
+    rnd = random.Random(seed)
+    now = START
+    end = now + dt.timedelta(days=days)
+    lines = 0
+
+    with open(path, 'w', encoding='utf-8') as fp:
+        while now < end:
+            location_data = [cd.LocationData(
+                location=cd.Location(name=place, lati=59.9 + i / 100, long=10.7 + i / 100),
+                temperature=round(rnd.gauss(5, 8), 1),
+                pressure=round(rnd.gauss(1010, 10), 1),
+                humidity=round(rnd.uniform(30, 100), 1),
+                cloud=round(rnd.uniform(0, 100), 1),
+                wind_speed=round(rnd.expovariate(0.4), 1),
+                pm10=round(rnd.expovariate(0.06), 6),
+            ) for i, place in enumerate(cd.PLACES)]
+            print(cd.format_record(cd.EntryObj(location_data=location_data, time=now)), file=fp)
+            # Timer runs drift a little, like the real data
+            now += step + dt.timedelta(microseconds=rnd.randrange(1_000_000))
+            lines += 1
+
+    return lines
+
+
+def bounds(query: Query) -> tuple[dt.datetime | None, dt.datetime | None]:
+    if query.days is None:
+        return None, None
+    return (START + dt.timedelta(days=query.days[0]),
+            START + dt.timedelta(days=query.days[1]))
+
+
+def consume(items: Iterable[Any]) -> int:
+    return sum(1 for _ in items)
+
+
+def run_query(path: str, query: Query) -> dict[str, Any]:
+    """Time one query stage by stage, then through the path `main()` takes.
+
+    The classic pipeline runs once with every stage wrapped in
+    `Metrics.stage`. A stage's pulls include those of the stages before
+    it, so subtracting those gives its own time, and the stages add up to
+    `classic_s`. The probes are counted in with the stages.
+    """
+    since, until = bounds(query)
+
+    # Warm the page cache and lazy imports so the first stage is not charged
+    consume(cd.read_lines(path, since, until))
+
+    metrics = cd.Metrics()
+    start = time.perf_counter()
+    lines = metrics.stage('read', cd.read_lines(path, since, until))
+    entries = metrics.stage('parse_data', cd.filter_date_range(cd.parse_data(lines), since, until))
+    entries = metrics.stage('filter_place', cd.filter_place(entries, query.place))
+    entries = metrics.stage('filter_time_range', cd.filter_time_range(entries, *query.hours))
+    ea, eb = itertools.tee(entries)
+    classic = (tuple(cd.extract_entries_field(ea, query.place, 'pm10')),
+               tuple(cd.extract_entries_field(eb, query.place, query.var)))
+    elapsed = time.perf_counter() - start
+
+    stages: dict[str, float] = {}
+    counts: dict[str, int] = {}
+    upstream = 0.0
+    for name, (seconds, items) in metrics.pipeline.items():
+        stages[name] = seconds - upstream
+        counts[name] = int(items)
+        upstream = seconds
+    stages['extract_entries_field'] = elapsed - upstream
+
+    start = time.perf_counter()
+    pipeline = cd.parse_data(cd.read_lines(path, since, until), query.place, query.hours)
+    pipeline = cd.filter_date_range(pipeline, since, until)
+    pipeline = cd.filter_time_range(pipeline, *query.hours)
+    _, columns = cd.query_fields(pipeline, query.place, ('pm10', query.var))
+    fast = time.perf_counter() - start
+
+    assert classic == (tuple(columns['pm10']), tuple(columns[query.var])), \
+        f'{query.name}: main() path disagrees with the classic pipeline'
+
+    return {
+        'name': query.name,
+        'lines': counts['read'],
+        'results': len(classic[0]),
+        'stages_s': stages,
+        'classic_s': elapsed,
+        'main_s': fast,
+        'classic_lines_per_s': counts['read'] / elapsed if elapsed else None,
+        'main_lines_per_s': counts['read'] / fast if fast else None,
+        'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the climate_data query pipeline')
+    parser.add_argument('-y', '--years',
+                        type=int,
+                        choices=range(1, 11),
+                        default=1,
+                        metavar='1-10',
+                        help='years of synthetic history')
+    parser.add_argument('-s', '--step',
+                        type=int,
+                        choices=range(1, 61),
+                        default=60,
+                        metavar='1-60',
+                        help='minutes between samples')
+    parser.add_argument('-d', '--data',
+                        type=str,
+                        help='reuse this history file (made by this script), generating it if missing')
+    parser.add_argument('-q', '--query',
+                        choices=[query.name for query in QUERIES],
+                        action='append',
+                        help='only run these queries')
+    parser.add_argument('-o', '--output',
+                        type=str,
+                        help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.data or os.path.join(tmp, 'data.json')
+        if not os.path.exists(path):
+            start = time.perf_counter()
+            generate(path, 365 * args.years, dt.timedelta(minutes=args.step))
+            print(f'generated `{path}` in {time.perf_counter() - start:.1f} s', file=sys.stderr)
+        if not os.path.isdir(path):
+            # Bounded queries should not pay for building the offset index
+            cd.update_index(path)
+
+        results = []
+        ctx = multiprocessing.get_context('spawn')
+        for query in QUERIES:
+            if args.query and query.name not in args.query:
+                continue
+            with ctx.Pool(1) as pool:
+                results.append(pool.apply(run_query, (path, query)))
+            print(f"{query.name}: {results[-1]['classic_s']:.2f} s classic, "
+                  f"{results[-1]['main_s']:.2f} s main", file=sys.stderr)
+
+        report = {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'time': dt.datetime.now().isoformat(timespec='seconds'),
+            'dataset': {
+                'path': args.data,
+                'years': args.years,
+                'step_minutes': args.step,
+                'bytes': os.path.getsize(path),
+            },
+            'queries': results,
+        }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fp:
+            json.dump(report, fp, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,41 @@
 #!/usr/bin/env python3.10
 
-from collections.abc import Generator, Iterable
-from typing import TypedDict, Any
+from __future__ import annotations
+from collections.abc import Generator, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, TypedDict, TypeVar, Any
 import argparse
+import contextlib
 import datetime as dt
-from io import TextIOWrapper
+import gzip
+import itertools
 import json
-import matplotlib.pyplot as plt
-import requests as req
+import math
+import os
+import random
+import re
+import signal
+import sqlite3
 import sys
-import numpy as np
-import itertools
+from array import array
+import threading
+import time
+import urllib.parse
+import warnings
+
+# numpy, matplotlib and requests are imported where they are used, so the
+# --fetch timer never pays for the plotting stack
+if TYPE_CHECKING:
+    import numpy as np
+    import numpy.typing as npt
+    import requests as req
+
+# Installed as a link into a copy of the repository, see the Makefile
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from common.httpcache import HttpCache, get_json, make_session  # noqa: E402
+from common.plotting import pyplot  # noqa: E402
+
+T = TypeVar('T')
 
 
 class Location(TypedDict):
@@ -33,7 +58,12 @@ class LocationData(TypedDict):
     pm10: float  # 0 - 600 μg/m^3
 
 
-class EntryObj(TypedDict):
+class PartialEntry(TypedDict, total=False):
+    # Stations left out because they could not be fetched in time
+    stale: list[str]
+
+
+class EntryObj(PartialEntry):
     time: dt.datetime
     location_data: list[LocationData]
 
@@ -61,6 +91,27 @@ PLACES = (
         'Brynbanen'
         )
 
+# API docs: https://api.nilu.no/
+NILU_URL = 'https://api.nilu.no/aq/utd?areas=oslo&components=pm10'
+# API docs: https://api.met.no/weatherapi/locationforecast/2.0/documentation
+MET_URL = 'https://api.met.no/weatherapi/locationforecast/2.0/compact?lat={}&lon={}'
+# Read from every station NILU lists
+NILU_FIELDS = {'station', 'latitude', 'longitude', 'value'}
+
+# Upper bound on concurrent met.no requests
+FETCH_WORKERS = 16
+# Seconds a whole fetch may take, and each request within it
+FETCH_DEADLINE = 60.0
+REQUEST_TIMEOUT = 10.0
+# Extra attempts per request, with jittered exponential backoff from BACKOFF
+RETRIES = 2
+BACKOFF = 0.5
+
+CACHE_DIR = '/var/local/climate_data/cache'
+# met.no forecasts are served on a ~1 km grid, so stations closer than this
+# share a forecast. Their terms of service also forbid more than 4 decimals.
+MET_COORD_DECIMALS = 2
+
 DATA_FIELDS = (
         'temperature',
         'pressure',
@@ -69,39 +120,381 @@ DATA_FIELDS = (
         'wind_speed',
         )
 
+# Every numeric column kept per station
+COLUMNS = DATA_FIELDS + ('pm10',)
+
+DATA_FILE = '/var/local/climate_data/data.json'
+
+# Sidecar of (time, byte offset) pairs, one per line of the data file
+INDEX_SUFFIX = '.idx'
+INDEX_DTYPE = [('time', '<i8'), ('offset', '<i8')]
+EPOCH = dt.datetime(1970, 1, 1)
+
+# A --file directory holds one segment per month. Closed months are gzipped.
+SEGMENT_RE = re.compile(r'(\d{4}-\d{2})\.json(\.gz)?')
+
+# Label for get_url_json timings by host
+API_NAMES = {
+    'api.nilu.no': 'nilu',
+    'api.met.no': 'met',
+}
+
+ROLLUPS_FILE = '/var/local/climate_data/rollups.db'
+# strftime format of a bucket for every rollup resolution
+RESOLUTIONS = {
+    'hour': '%Y-%m-%d %H',
+    'day': '%Y-%m-%d',
+}
+
+
+class Metrics:
+    """Wall times and counters of one run, for --profile and --metrics-file.
+
+    Pipeline stages are timed while items are pulled through them, which
+    includes the stages upstream, so each is reported minus the one before.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.requests: dict[str, list[float]] = {}  # api -> [count, seconds, max]
+        self.pipeline: dict[str, list[float]] = {}  # stage -> [seconds, items]
+        self.timers: dict[str, float] = {}
+        self.started = time.time()
+
+    def request(self, url: str, seconds: float) -> None:
+        host = urllib.parse.urlsplit(url).hostname or ''
+        with self.lock:
+            acc = self.requests.setdefault(API_NAMES.get(host, host), [0, 0.0, 0.0])
+            acc[0] += 1
+            acc[1] += seconds
+            acc[2] = max(acc[2], seconds)
+
+    def stage(self, name: str, items: Iterable[T]) -> Generator[T, None, None]:
+        # Registered now, not on first pull, so stages keep pipeline order
+        acc = self.pipeline.setdefault(name, [0.0, 0])
+
+        def pull() -> Generator[T, None, None]:
+            it = iter(items)
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    acc[0] += time.perf_counter() - start
+                    return None
+                acc[0] += time.perf_counter() - start
+                acc[1] += 1
+                yield item
+
+        return pull()
+
+    @contextlib.contextmanager
+    def timer(self, name: str, pipeline: bool = False) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield None
+        finally:
+            elapsed = time.perf_counter() - start
+            if pipeline:
+                self.pipeline.setdefault(name, [0.0, 0])[0] += elapsed
+            else:
+                self.timers[name] = self.timers.get(name, 0.0) + elapsed
+
+    def stage_seconds(self) -> dict[str, float]:
+        stages, upstream = {}, 0.0
+        for name, (seconds, _) in self.pipeline.items():
+            stages[name] = max(seconds - upstream, 0.0)
+            upstream = max(upstream, seconds)
+        return stages
+
+    def render(self) -> str:
+        """The metrics in the Prometheus node-exporter textfile format."""
+        lines = []
+
+        def metric(name: str, kind: str, doc: str, samples: Iterable[tuple[str, float]]) -> None:
+            samples = list(samples)
+            if not samples:
+                return None
+            lines.append(f'# HELP climate_data_{name} {doc}')
+            lines.append(f'# TYPE climate_data_{name} {kind}')
+            for labels, value in samples:
+                lines.append(f'climate_data_{name}{labels} {value}')
+
+        metric('requests', 'gauge', 'API requests in the last run.',
+               ((f'{{api="{api}"}}', acc[0]) for api, acc in self.requests.items()))
+        metric('request_seconds', 'gauge', 'Wall time spent in API requests in the last run.',
+               ((f'{{api="{api}"}}', acc[1]) for api, acc in self.requests.items()))
+        metric('request_max_seconds', 'gauge', 'Slowest API request in the last run.',
+               ((f'{{api="{api}"}}', acc[2]) for api, acc in self.requests.items()))
+        metric('stage_seconds', 'gauge', 'Wall time of each stage in the last run.',
+               itertools.chain(((f'{{stage="{name}"}}', secs) for name, secs in self.stage_seconds().items()),
+                               ((f'{{stage="{name}"}}', secs) for name, secs in self.timers.items())))
+        metric('stage_items', 'gauge', 'Lines or entries out of each stage in the last run.',
+               ((f'{{stage="{name}"}}', acc[1]) for name, acc in self.pipeline.items() if acc[1]))
+        metric('last_run_timestamp_seconds', 'gauge', 'Start of the last run.',
+               [('', self.started)])
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str) -> None:
+        """Replace `path` atomically so the node exporter never reads half a file."""
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fp:
+            fp.write(self.render())
+        os.replace(tmp, path)
+
+
+# Set by --profile / --metrics-file. While None the probes below are no-ops.
+METRICS: Metrics | None = None
+
+
+def measured(name: str, items: Iterable[T]) -> Iterable[T]:
+    return items if METRICS is None else METRICS.stage(name, items)
+
+
+def timed(name: str, pipeline: bool = False) -> contextlib.AbstractContextManager[None]:
+    return contextlib.nullcontext() if METRICS is None else METRICS.timer(name, pipeline)
+
+
+def normalize_url(url: str) -> str:
+    """Sort query parameters and round coordinates to what met.no serves."""
+    parts = urllib.parse.urlsplit(url)
+    query = []
+    for key, val in sorted(urllib.parse.parse_qsl(parts.query)):
+        if key in ('lat', 'lon'):
+            val = f'{float(val):.{MET_COORD_DECIMALS}f}'
+        query.append((key, val))
+
+    return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query, safe=',')))
+
+
+def get_url_json(url: str, headers: dict[str, str],
+                 session: req.Session | None = None,
+                 cache: HttpCache | None = None,
+                 timeout: float | None = None) -> Any:
+    if METRICS is None:
+        return get_json(url, headers, session, cache, timeout)
+
+    start = time.perf_counter()
+    try:
+        return get_json(url, headers, session, cache, timeout)
+    finally:
+        METRICS.request(url, time.perf_counter() - start)
+
+
+def get_with_retry(url: str, session: req.Session, cache: HttpCache | None,
+                   deadline: float, timeout: float, retries: int) -> Any:
+    """`get_url_json` with retries, giving up at the monotonic `deadline`.
+
+    Connection errors, timeouts and 5xx responses are retried after a
+    full-jitter exponential backoff. Other errors are raised at once.
+    """
+    import requests as req
+    for attempt in range(retries + 1):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise req.Timeout(f'fetch deadline passed before `{url}`')
+        try:
+            return get_url_json(url, HEADERS, session, cache, timeout=min(timeout, remaining))
+        except req.HTTPError as err:
+            if err.response is None or err.response.status_code < 500 or attempt == retries:
+                raise
+        except (req.ConnectionError, req.Timeout):
+            if attempt == retries:
+                raise
+
+        delay = random.uniform(0, BACKOFF * 2 ** attempt)
+        time.sleep(max(min(delay, deadline - time.monotonic()), 0))
+
+
+def valid_stations(nilu_data: Any) -> bool:
+    """A non-empty list of stations, each with the fields that are read."""
+    return isinstance(nilu_data, list) and bool(nilu_data) and all(
+        isinstance(place, dict) and NILU_FIELDS <= place.keys() for place in nilu_data)
+
+
+def fetch_location_data(workers: int = FETCH_WORKERS,
+                        nilu_url: str = NILU_URL,
+                        met_url: str = MET_URL,
+                        cache: HttpCache | None = None,
+                        session: req.Session | None = None,
+                        stale: list[str] | None = None,
+                        deadline: float = FETCH_DEADLINE,
+                        timeout: float = REQUEST_TIMEOUT,
+                        retries: int = RETRIES
+                        ) -> Generator[LocationData, None, None]:
+    """Yield every station NILU reports, with its met.no forecast.
+
+    The whole fetch is bounded by `deadline` seconds and each request by
+    `timeout`. Stations that cannot be fetched in time are left out and
+    their names appended to `stale`. If NILU fails, every station in
+    PLACES is stale.
+    """
+    import requests as req
+    give_up = time.monotonic() + deadline
+    stale = [] if stale is None else stale
+
+    with contextlib.nullcontext(session) if session else make_session(workers, hosts=2) as session:
+        try:
+            nilu_data = get_with_retry(nilu_url, session, cache, give_up, timeout, retries)
+        except (req.RequestException, ValueError) as err:
+            print(f"ERROR: {err}", file=sys.stderr)
+            stale.extend(PLACES)
+            return None
+        if not valid_stations(nilu_data):
+            print(f"ERROR: malformed station list from `{nilu_url}`", file=sys.stderr)
+            stale.extend(PLACES)
+            return None
+
+        # Stations sharing a forecast grid point are only requested once
+        met_urls = [normalize_url(met_url.format(place['latitude'], place['longitude']))
+                    for place in nilu_data]
+
+        pool = ThreadPoolExecutor(max_workers=max(workers, 1))
+        futures = {url: pool.submit(get_with_retry, url, session, cache, give_up, timeout, retries)
+                   for url in dict.fromkeys(met_urls)}
+        wait(futures.values(), timeout=max(give_up - time.monotonic(), 0))
+        # Stragglers are abandoned; their own timeouts end them
+        pool.shutdown(wait=False, cancel_futures=True)
+
+        forecasts = {}
+        for url, future in futures.items():
+            if not future.done():
+                print(f"ERROR: fetch deadline passed waiting for `{url}`", file=sys.stderr)
+            elif future.exception() is not None:
+                print(f"ERROR: {future.exception()}", file=sys.stderr)
+            else:
+                forecasts[url] = future.result()
+
+        for place, url in zip(nilu_data, met_urls):
+            try:
+                met_pdata = forecasts[url]['properties']['timeseries'][0]['data']['instant']['details']
+                location = LocationData(
+                        location=Location(name=place['station'],
+                                          lati=place['latitude'],
+                                          long=place['longitude']
+                                          ),
+                        temperature=met_pdata['air_temperature'],
+                        pressure=met_pdata['air_pressure_at_sea_level'],
+                        humidity=met_pdata['relative_humidity'],
+                        cloud=met_pdata['cloud_area_fraction'],
+                        wind_speed=met_pdata['wind_speed'],
+                        pm10=place['value'])
+            except (KeyError, IndexError, TypeError):
+                stale.append(place['station'])
+                continue
+
+            yield location
+
+
+def fetch_entry(workers: int = FETCH_WORKERS,
+                nilu_url: str = NILU_URL,
+                met_url: str = MET_URL,
+                cache: HttpCache | None = None,
+                session: req.Session | None = None,
+                deadline: float = FETCH_DEADLINE,
+                timeout: float = REQUEST_TIMEOUT,
+                retries: int = RETRIES) -> EntryObj:
+    """One record, listing any stations left out under `stale`."""
+    stale: list[str] = []
+    location_data = list(fetch_location_data(workers, nilu_url, met_url, cache, session,
+                                             stale, deadline, timeout, retries))
+    entry = EntryObj(location_data=location_data, time=dt.datetime.now())
+    if stale:
+        entry['stale'] = stale
+    return entry
+
+
+def format_record(entry: EntryObj) -> str:
+    return json.dumps({**entry, 'time': str(entry['time'])})
+
+
+def write_record(fd: int, entry: EntryObj) -> None:
+    """Append one record with a single O_APPEND write, retrying short writes."""
+    view = memoryview((format_record(entry) + '\n').encode())
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def collect(path: str, interval: float,
+            fsync_every: int = 1,
+            workers: int = FETCH_WORKERS,
+            cache: HttpCache | None = None,
+            rollups: str | None = None,
+            nilu_url: str = NILU_URL,
+            met_url: str = MET_URL,
+            metrics_file: str | None = None,
+            deadline: float = FETCH_DEADLINE,
+            timeout: float = REQUEST_TIMEOUT,
+            retries: int = RETRIES) -> int:
+    """Append a record to `path` every `interval` seconds until SIGTERM/SIGINT.
 
-def get_url_json(url: str, headers: dict[str, str]) -> Any:
-    res = req.get(url, headers=headers)
-    if res.status_code != 200:
-        print(f"ERROR: invalid status code from `{url}`", file=sys.stderr)
-        raise req.ConnectionError
+    If `path` is a segment directory records go to the current month, and
+    months left behind are compressed.
 
-    return json.loads(res.text)
+    One session is kept for the life of the process so connections are
+    reused between ticks. Signals only set a flag, so the record being
+    written is always completed before exiting. The file is fsynced every
+    `fsync_every` records (never if 0) and on exit. With metrics enabled,
+    `metrics_file` is rewritten after every tick. Returns the number of
+    records written.
+    """
+    import requests as req
+    stop = threading.Event()
 
+    def on_signal(signum: int, frame: Any) -> None:
+        stop.set()
 
-def fetch_location_data() -> Generator[LocationData, None, None]:
-    # API docs: https://api.nilu.no/
-    nilu_url = "https://api.nilu.no/aq/utd?areas=oslo&components=pm10"
-    nilu_data = get_url_json(nilu_url, headers=HEADERS)
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
 
-    for place in nilu_data:
-        # API docs: https://api.met.no/weatherapi/locationforecast/2.0/documentation
-        met_url = "https://api.met.no/weatherapi/locationforecast/2.0/compact?lat={}&lon={}"
-        met_url = met_url.format(place['latitude'], place['longitude'])
-        met_data = get_url_json(met_url, headers=HEADERS)
-        met_pdata = met_data['properties']['timeseries'][0]['data']['instant']['details']
+    target = segment_path(path, dt.datetime.now())
+    fd = os.open(target, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    conn = open_rollups(rollups) if rollups else None
+    written = 0
+    tick = time.monotonic()
+    try:
+        with make_session(workers, hosts=2) as session:
+            while not stop.is_set():
+                try:
+                    with timed('fetch'):
+                        entry = fetch_entry(workers, nilu_url, met_url, cache, session,
+                                            deadline, timeout, retries)
+                except (req.RequestException, KeyError, ValueError) as err:
+                    print(f"ERROR: fetch failed: {err!r}", file=sys.stderr)
+                else:
+                    if segment_path(path, entry['time']) != target:
+                        # New month: move on to its segment and compress the old ones
+                        os.fsync(fd)
+                        os.close(fd)
+                        target = segment_path(path, entry['time'])
+                        fd = os.open(target, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                        compress_segments(path, entry['time'].strftime('%Y-%m'))
+                    with timed('write'):
+                        write_record(fd, entry)
+                        written += 1
+                        if fsync_every and written % fsync_every == 0:
+                            os.fsync(fd)
+                    if conn is not None:
+                        update_rollups(conn, [entry])
 
-        yield LocationData(
-                location=Location(name=place['station'],
-                                  lati=place['latitude'],
-                                  long=place['longitude']
-                                  ),
-                temperature=met_pdata['air_temperature'],
-                pressure=met_pdata['air_pressure_at_sea_level'],
-                humidity=met_pdata['relative_humidity'],
-                cloud=met_pdata['cloud_area_fraction'],
-                wind_speed=met_pdata['wind_speed'],
-                pm10=place['value'])
+                if METRICS is not None and metrics_file:
+                    METRICS.write(metrics_file)
+                    METRICS.reset()
+
+                # Skip ticks missed by a slow fetch instead of bursting
+                tick = max(tick + interval, time.monotonic())
+                stop.wait(tick - time.monotonic())
+    finally:
+        os.fsync(fd)
+        os.close(fd)
+        if conn is not None:
+            conn.close()
+
+    return written
 
 
 def arg_parse_hour(val: str) -> tuple[int, int]:
@@ -115,6 +508,13 @@ def arg_parse_hour(val: str) -> tuple[int, int]:
     return (start, end)
 
 
+def arg_parse_date(val: str) -> dt.date:
+    try:
+        return dt.date.fromisoformat(val)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'{val} is not a valid date. Use YYYY-MM-DD')
+
+
 def get_arg_namespace() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description='Compare NILU and Metrologisk Institutt data',
                                      prefix_chars='--',
@@ -123,11 +523,104 @@ def get_arg_namespace() -> argparse.Namespace:
                         action='store_true',
                         required=False,
                         help='fetch data and print to stdout')
+    parser.add_argument('-D', '--daemon',
+                        action='store_true',
+                        required=False,
+                        help='keep running and append a record to --file every --interval')
+    parser.add_argument('-i', '--interval',
+                        metavar='SECONDS',
+                        type=float,
+                        required=False,
+                        default=3600,
+                        help='seconds between fetches in --daemon mode')
+    parser.add_argument('--fsync',
+                        metavar='N',
+                        type=int,
+                        required=False,
+                        default=1,
+                        help='fsync --file every N records in --daemon mode (0: only on exit)')
+    parser.add_argument('--profile',
+                        action='store_true',
+                        required=False,
+                        help='print per-stage timings and counts to stderr')
+    parser.add_argument('--metrics-file',
+                        metavar='FILE',
+                        type=str,
+                        required=False,
+                        help='write timings in the Prometheus node-exporter textfile format')
+    parser.add_argument('-j', '--workers',
+                        type=int,
+                        required=False,
+                        default=FETCH_WORKERS,
+                        help='max concurrent requests when fetching')
+    parser.add_argument('--deadline',
+                        metavar='SECONDS',
+                        type=float,
+                        required=False,
+                        default=FETCH_DEADLINE,
+                        help='give up on stations not fetched within this time')
+    parser.add_argument('--timeout',
+                        metavar='SECONDS',
+                        type=float,
+                        required=False,
+                        default=REQUEST_TIMEOUT,
+                        help='timeout of each request')
+    parser.add_argument('--retries',
+                        metavar='N',
+                        type=int,
+                        required=False,
+                        default=RETRIES,
+                        help='extra attempts after a timeout, connection error or 5xx')
+    parser.add_argument('--cache-dir',
+                        type=str,
+                        required=False,
+                        default=CACHE_DIR,
+                        help='directory for cached API responses')
+    parser.add_argument('--no-cache',
+                        action='store_true',
+                        required=False,
+                        help='always download API responses')
+    parser.add_argument('--cache-stats',
+                        action='store_true',
+                        required=False,
+                        help='print cache hit/miss counts to stderr after fetching')
+    parser.add_argument('-R', '--rollups',
+                        metavar='FILE',
+                        type=str,
+                        required=False,
+                        help=f'hourly/daily rollup database, updated by --fetch (query default: {ROLLUPS_FILE})')
+    parser.add_argument('-r', '--resolution',
+                        choices=tuple(RESOLUTIONS),
+                        required=False,
+                        help='plot hourly or daily means from the rollups instead of raw data')
+    parser.add_argument('--rebuild-rollups',
+                        action='store_true',
+                        required=False,
+                        help='recompute the rollups from --file')
+    parser.add_argument('--verify-rollups',
+                        action='store_true',
+                        required=False,
+                        help='check the rollups against a full recomputation from --file')
     parser.add_argument('-F', '--file',
-                        type=argparse.FileType('r'),
+                        type=str,
                         required=False,
-                        default='/var/local/climate_data/data.json',
-                        help='choose which file to read data from')
+                        default=DATA_FILE,
+                        help='choose which file or segment directory to read data from')
+    parser.add_argument('--compact',
+                        metavar='DIR',
+                        type=str,
+                        required=False,
+                        help='split --file into monthly segments in DIR and compress closed months')
+    parser.add_argument('-S', '--store',
+                        metavar='DIR',
+                        type=str,
+                        required=False,
+                        help='read data from a columnar store instead of --file')
+    parser.add_argument('--convert',
+                        metavar='DIR',
+                        type=str,
+                        required=False,
+                        help='convert --file into a columnar store in DIR, or add its newer entries')
     parser.add_argument('-w', '--wind-speed',
                         action='store_true',
                         required=False,
@@ -137,6 +630,18 @@ def get_arg_namespace() -> argparse.Namespace:
                         required=False,
                         default=(12, 13),
                         help='specify time range')
+    parser.add_argument('--from',
+                        dest='date_from',
+                        metavar='DATE',
+                        type=arg_parse_date,
+                        required=False,
+                        help='first date to include (YYYY-MM-DD)')
+    parser.add_argument('--to',
+                        dest='date_to',
+                        metavar='DATE',
+                        type=arg_parse_date,
+                        required=False,
+                        help='last date to include (YYYY-MM-DD)')
     parser.add_argument('-p', '--place',
                         choices=PLACES,
                         required=False,
@@ -147,15 +652,300 @@ def get_arg_namespace() -> argparse.Namespace:
                         required=False,
                         default='temperature',
                         help='specify variable')
+    parser.add_argument('-b', '--batch',
+                        action='store_true',
+                        required=False,
+                        help='summarise many places and variables in one pass')
+    parser.add_argument('--places',
+                        nargs='+',
+                        choices=PLACES,
+                        required=False,
+                        default=PLACES,
+                        metavar='PLACE',
+                        help='places for --batch (default: all)')
+    parser.add_argument('--vars',
+                        nargs='+',
+                        choices=DATA_FIELDS,
+                        required=False,
+                        default=DATA_FIELDS,
+                        metavar='VAR',
+                        help='variables for --batch (default: all)')
+    parser.add_argument('--format',
+                        choices=('table', 'json'),
+                        required=False,
+                        default='table',
+                        help='output format for --batch')
+    parser.add_argument('--plot',
+                        action='store_true',
+                        required=False,
+                        help='plot the --batch correlation matrix')
+    parser.add_argument('-o', '--output',
+                        metavar='FILE',
+                        type=str,
+                        required=False,
+                        help='render the plot to FILE (.png, .svg, ...) without a display')
 
     return parser.parse_args()
 
 
-def parse_data(file: TextIOWrapper) -> Generator[EntryObj, None, None]:
+def to_micros(time: dt.datetime) -> int:
+    return (time - EPOCH) // dt.timedelta(microseconds=1)
+
+
+def raw_time(line: bytes) -> bytes | None:
+    """Value of a line's `time` field, found without decoding the line."""
+    start = line.rfind(b'"time": "')
+    if start < 0:
+        return None
+    start += len(b'"time": "')
+    return line[start:line.find(b'"', start)]
+
+
+def line_micros(line: bytes) -> int | None:
+    raw = raw_time(line)
+    try:
+        return None if raw is None else to_micros(dt.datetime.fromisoformat(raw.decode()))
+    except ValueError:
+        return None
+
+
+def update_index(path: str) -> tuple[npt.NDArray[Any], int]:
+    """Load the offset index of `path`, indexing any lines appended since.
+
+    Returns the index and the byte offset where indexed data ends. The index
+    is rebuilt if the data file no longer matches it, and kept in memory only
+    if the sidecar cannot be written.
+    """
+    import numpy as np
+    index_path = path + INDEX_SUFFIX
+    try:
+        index = np.fromfile(index_path, dtype=INDEX_DTYPE)
+    except (OSError, ValueError):
+        index = np.zeros(0, dtype=INDEX_DTYPE)
+
+    new = array('q')
+    with open(path, 'rb') as fp:
+        pos = 0
+        if len(index):
+            last = int(index['offset'][-1])
+            fp.seek(last)
+            line = fp.readline()
+            if line.endswith(b'\n') and line_micros(line) == index['time'][-1]:
+                pos = last + len(line)
+            else:
+                index = index[:0]
+                fp.seek(0)
+
+        rebuild = not len(index)
+        for line in fp:
+            if not line.endswith(b'\n'):
+                break  # still being written
+            time = line_micros(line)
+            if time is not None:
+                new.extend((time, pos))
+            pos += len(line)
+
+    if new:
+        added = np.frombuffer(new, dtype=INDEX_DTYPE)
+        try:
+            with open(index_path, 'wb' if rebuild else 'ab') as fp:
+                added.tofile(fp)
+        except OSError:
+            pass
+        index = np.concatenate((index, added))
+
+    return index, pos
+
+
+def read_lines(path: str,
+               since: dt.datetime | None = None,
+               until: dt.datetime | None = None
+               ) -> Generator[bytes, None, None]:
+    """Yield the raw lines of `path`, seeking straight to [since, until).
+
+    Without bounds the whole file is read. With bounds the offset index picks
+    the byte range. If the file is not in time order the whole file is read
+    and it is up to `filter_date_range` to drop the rest.
+
+    If `path` is a segment directory, only the months overlapping the bounds
+    are opened and read in order, decompressing closed months as a stream.
+    """
+    if os.path.isdir(path):
+        for segment in list_segments(path, since, until):
+            if segment.endswith('.gz'):
+                with gzip.open(segment, 'rb') as fp:
+                    yield from fp
+            else:
+                yield from read_lines(segment, since, until)
+        return None
+
+    with open(path, 'rb') as fp:
+        if since is None and until is None:
+            yield from fp
+            return None
+
+        import numpy as np
+        index, end = update_index(path)
+        times, offsets = index['time'], index['offset']
+        start = 0
+        if np.all(times[1:] >= times[:-1]):
+            if since is not None:
+                i = np.searchsorted(times, to_micros(since))
+                start = int(offsets[i]) if i < len(index) else end
+            if until is not None:
+                i = np.searchsorted(times, to_micros(until))
+                end = int(offsets[i]) if i < len(index) else end
+
+        fp.seek(start)
+        pos = start
+        for line in fp:
+            if pos >= end:
+                break
+            pos += len(line)
+            yield line
+
+
+def list_segments(path: str,
+                  since: dt.datetime | None = None,
+                  until: dt.datetime | None = None) -> list[str]:
+    """Monthly segments of a directory overlapping [since, until), oldest first.
+
+    If a month is both plain and compressed (an interrupted compaction), the
+    compressed copy wins.
+    """
+    first = since.strftime('%Y-%m') if since is not None else ''
+    last = (until - dt.timedelta(microseconds=1)).strftime('%Y-%m') if until is not None else '9999-99'
+    months: dict[str, str] = {}
+    for name in os.listdir(path):
+        match = SEGMENT_RE.fullmatch(name)
+        if match is None or not first <= match[1] <= last:
+            continue
+        if match[2] or match[1] not in months:
+            months[match[1]] = name
+
+    return [os.path.join(path, months[month]) for month in sorted(months)]
+
+
+def segment_path(path: str, time: dt.datetime) -> str:
+    """File a record at `time` is appended to: `path` itself or its month."""
+    if os.path.isdir(path):
+        return os.path.join(path, time.strftime('%Y-%m.json'))
+    return path
+
+
+def compress_segments(path: str, before: str) -> list[tuple[str, int, int]]:
+    """Gzip every plain segment for a month before `before` (YYYY-MM).
+
+    Returns (segment, plain size, compressed size) for each one.
+    """
+    done = []
+    for name in sorted(os.listdir(path)):
+        match = SEGMENT_RE.fullmatch(name)
+        if match is None or match[2] or match[1] >= before:
+            continue
+
+        plain = os.path.join(path, name)
+        tmp = plain + '.gz.tmp'
+        with open(plain, 'rb') as src, gzip.open(tmp, 'wb') as dst:
+            while chunk := src.read(1 << 20):
+                dst.write(chunk)
+        os.replace(tmp, plain + '.gz')
+        done.append((name, os.path.getsize(plain), os.path.getsize(plain + '.gz')))
+        os.remove(plain)
+        if os.path.exists(plain + INDEX_SUFFIX):
+            os.remove(plain + INDEX_SUFFIX)
+
+    return done
+
+
+def split_segments(src: str, dest: str) -> int:
+    """Split an NDJSON file into monthly segments in the empty directory `dest`.
+
+    Lines without a readable time go to the month of the line before them.
+    Returns the number of lines written.
+    """
+    os.makedirs(dest, exist_ok=True)
+    if os.listdir(dest):
+        raise FileExistsError(f'`{dest}` is not empty')
+
+    count = 0
+    month = b''
+    out = None
+    try:
+        with open(src, 'rb') as fp:
+            for line in fp:
+                raw = raw_time(line)
+                if raw is not None and raw[:7] != month and re.fullmatch(rb'\d{4}-\d{2}', raw[:7]):
+                    month = raw[:7]
+                    if out is not None:
+                        out.close()
+                    out = open(os.path.join(dest, month.decode() + '.json'), 'ab')
+                if out is None:
+                    raise ValueError(f'`{src}` does not start with a timestamped line')
+                out.write(line if line.endswith(b'\n') else line + b'\n')
+                count += 1
+    finally:
+        if out is not None:
+            out.close()
+
+    return count
+
+
+def decode_entry(line: str | bytes) -> EntryObj:
+    pline = json.loads(line)
+    pline['time'] = dt.datetime.fromisoformat(pline['time'])
+    return pline  # type: ignore
+
+
+def parse_data(file: Iterable[str | bytes],
+               place: str | None = None,
+               hours: tuple[dt.time, dt.time] | None = None
+               ) -> Generator[EntryObj, None, None]:
+    """Decode entries, optionally pushing the place and hour filters down.
+
+    With `hours`, lines whose raw `time` bytes fall outside the window are
+    skipped undecoded. With `place`, only that station's object is decoded.
+    Lines not laid out the way `--fetch` writes them are decoded in full, so
+    the downstream filters see exactly what they would have without pushdown.
+    """
+    if place is None and hours is None:
+        yield from map(decode_entry, file)
+        return None
+
+    lo = hi = b''
+    if hours is not None:
+        lo, hi = hours[0].isoformat().encode(), hours[1].isoformat().encode()
+    station = b''
+    names: tuple[bytes, ...] = ()
+    if place is not None:
+        name = json.dumps(place).encode()
+        station = b'{"location": {"name": ' + name
+        names = (name, place.encode())
+    decoder = json.JSONDecoder()
+
     for line in file:
-        pline = json.loads(line)
-        pline['time'] = dt.datetime.fromisoformat(pline['time'])
-        yield pline
+        if isinstance(line, str):
+            line = line.encode()
+
+        raw = raw_time(line)
+        if raw is None or len(raw) not in (19, 26) or not line.isascii():
+            yield decode_entry(line)
+            continue
+
+        if hours is not None and not lo <= raw[11:] <= hi:
+            continue
+
+        if place is not None:
+            i = line.find(station)
+            if i < 0 or line.find(station, i + 1) >= 0:
+                if any(name in line for name in names):
+                    yield decode_entry(line)
+                continue
+            location, _ = decoder.raw_decode(line.decode(), i)
+            yield EntryObj(time=dt.datetime.fromisoformat(raw.decode()),
+                           location_data=[location])
+        else:
+            yield decode_entry(line)
 
 
 def filter_time_range(entries: Iterable[EntryObj],
@@ -167,6 +957,15 @@ def filter_time_range(entries: Iterable[EntryObj],
             yield entry
 
 
+def filter_date_range(entries: Iterable[EntryObj],
+                      since: dt.datetime | None,
+                      until: dt.datetime | None
+                      ) -> Generator[EntryObj, None, None]:
+    for entry in entries:
+        if (since is None or since <= entry['time']) and (until is None or entry['time'] < until):
+            yield entry
+
+
 def filter_place(entries: Iterable[EntryObj], place: str
                  ) -> Generator[EntryObj, None, None]:
     for entry in entries:
@@ -183,26 +982,611 @@ def extract_entries_field(entries: Iterable[EntryObj], place: str, key: str
                 yield i[key]  # type: ignore
 
 
+def query_fields(entries: Iterable[EntryObj], place: str, fields: Iterable[str]
+                 ) -> tuple[npt.NDArray[np.datetime64], dict[str, npt.NDArray[np.float64]]]:
+    """Collect the time column and `fields` of one station in a single scan.
+
+    Each entry's station list is searched once and values go straight into
+    typed buffers, so memory is proportional to the returned arrays.
+    """
+    import numpy as np
+    fields = tuple(fields)
+    times = array('q')
+    columns = {field: array('d') for field in fields}
+
+    for entry in entries:
+        for location in entry['location_data']:
+            if location['location']['name'] != place:
+                continue
+            times.append(to_micros(entry['time']))
+            for field in fields:
+                val = location[field]  # type: ignore
+                columns[field].append(np.nan if val is None else val)
+
+    return (np.frombuffer(times, dtype=np.int64).astype('datetime64[us]'),
+            {field: np.frombuffer(column, dtype=np.float64) for field, column in columns.items()})
+
+
+def query_matrix(entries: Iterable[EntryObj], places: Iterable[str], fields: Iterable[str]
+                 ) -> tuple[npt.NDArray[np.datetime64], dict[str, npt.NDArray[np.float64]]]:
+    """Collect `fields` of many stations in a single scan.
+
+    Each field is returned shaped (station, time) in the order of `places`,
+    with NaN where a station is missing from an entry.
+    """
+    import numpy as np
+    stations = {place: i for i, place in enumerate(places)}
+    fields = tuple(fields)
+    size = len(stations)
+    times = array('q')
+    columns = {field: array('d') for field in fields}
+    blank = array('d', [np.nan]) * size
+
+    for t, entry in enumerate(entries):
+        times.append(to_micros(entry['time']))
+        for column in columns.values():
+            column.extend(blank)
+        for location in entry['location_data']:
+            s = stations.get(location['location']['name'])
+            if s is None:
+                continue
+            for field in fields:
+                val = location[field]  # type: ignore
+                if val is not None:
+                    columns[field][t * size + s] = val
+
+    return (np.frombuffer(times, dtype=np.int64).astype('datetime64[us]'),
+            {field: np.frombuffer(column, dtype=np.float64).reshape(-1, size).T
+             for field, column in columns.items()})
+
+
+def pearson(x: npt.NDArray[np.float64], y: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+    """Row-wise Pearson correlation over the samples where both are present."""
+    import numpy as np
+    mask = ~(np.isnan(x) | np.isnan(y))
+    n = mask.sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dx = np.where(mask, x - (np.where(mask, x, 0).sum(axis=-1) / n)[..., None], 0)
+        dy = np.where(mask, y - (np.where(mask, y, 0).sum(axis=-1) / n)[..., None], 0)
+        r = (dx * dy).sum(axis=-1) / np.sqrt((dx * dx).sum(axis=-1) * (dy * dy).sum(axis=-1))
+
+    return np.asarray(r, dtype=np.float64)
+
+
+def summarise(places: tuple[str, ...], fields: tuple[str, ...],
+              columns: dict[str, npt.NDArray[np.float64]]) -> dict[str, Any]:
+    """Means, sample counts and pm10 correlations as a stations x variables matrix."""
+    import numpy as np
+    with np.errstate(invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mean = np.stack([np.nanmean(columns[field], axis=-1) for field in ('pm10',) + fields], axis=-1)
+    count = (~np.isnan(columns['pm10'])).sum(axis=-1)
+    corr = np.stack([pearson(columns['pm10'], columns[field]) for field in fields], axis=-1)
+
+    return {
+        'places': list(places),
+        'vars': list(fields),
+        'count': count.tolist(),
+        'mean': {var: [None if np.isnan(v) else float(v) for v in mean[:, i]]
+                 for i, var in enumerate(('pm10',) + fields)},
+        'corr_pm10': {var: [None if np.isnan(v) else float(v) for v in corr[:, i]]
+                      for i, var in enumerate(fields)},
+    }
+
+
+def print_summary(summary: dict[str, Any]) -> None:
+    means = tuple(summary['mean'])
+    corrs = tuple(summary['corr_pm10'])
+    width = max(map(len, summary['places'] + ['place']))
+    cells = [f'{var:>11}' for var in means] + [f'{"r " + var:>13}' for var in corrs]
+    print(f'{"place":<{width}} {"count":>6} ' + ' '.join(cells))
+
+    def fmt(val: float | None, size: int, prec: int) -> str:
+        return f'{"-":>{size}}' if val is None else f'{val:>{size}.{prec}f}'
+
+    for i, place in enumerate(summary['places']):
+        row = [fmt(summary['mean'][var][i], 11, 2) for var in means]
+        row += [fmt(summary['corr_pm10'][var][i], 13, 3) for var in corrs]
+        print(f'{place:<{width}} {summary["count"][i]:>6} ' + ' '.join(row))
+
+
+def time_of_day(time: dt.time) -> np.timedelta64:
+    import numpy as np
+    return np.timedelta64(dt.timedelta(hours=time.hour,
+                                       minutes=time.minute,
+                                       seconds=time.second,
+                                       microseconds=time.microsecond), 'us')
+
+
+def store_end(store: str) -> dt.datetime | None:
+    """Time of the newest entry in a columnar store, None if there is none."""
+    import numpy as np
+    try:
+        times = np.load(os.path.join(store, 'time.npy'), mmap_mode='r')
+    except OSError:
+        return None
+    return times.max().astype(dt.datetime) if len(times) else None
+
+
+def latest_record(path: str) -> dt.datetime | None:
+    """Time of the newest record in NDJSON history, from its offset index."""
+    if os.path.isdir(path):
+        segments = list_segments(path)
+        if not segments:
+            return None
+        path = segments[-1]
+        if path.endswith('.gz'):
+            # Only when nothing was collected since the month was closed
+            with gzip.open(path, 'rb') as fp:
+                times = [t for t in map(line_micros, fp) if t is not None]
+            return EPOCH + dt.timedelta(microseconds=max(times)) if times else None
+
+    index, _ = update_index(path)
+    if not len(index):
+        return None
+    return EPOCH + dt.timedelta(microseconds=int(index['time'].max()))
+
+
+def warn_if_stale(store: str, file: str | None) -> None:
+    if file is None:
+        return None
+    try:
+        latest = latest_record(file)
+    except OSError:
+        return None
+    end = store_end(store)
+    if latest is not None and (end is None or latest > end):
+        print(f"WARNING: `{file}` has records up to {latest}, newer than `{store}` ({end}); "
+              f"run --convert again to add them", file=sys.stderr)
+
+    return None
+
+
+def convert_columnar(file: Iterable[str | bytes], dest: str) -> int:
+    """Write NDJSON history as one memory-mappable .npy file per column.
+
+    Field columns are shaped (station, time) so one station's series is
+    contiguous on disk. Stations missing from an entry are NaN and unset in
+    `present.npy`.
+
+    If `dest` already is a store, only entries newer than its last one are
+    added, and stations not seen before get new rows. Feed it
+    `read_lines(file, since=store_end(dest))` so the old history is not
+    even parsed. The columns are rewritten whole, time.npy last. Returns
+    the number of entries added.
+    """
+    import numpy as np
+    stations: dict[str, int] = {}
+    locations: list[Location] = []
+    old_times = np.zeros(0, dtype='datetime64[us]')
+    if os.path.exists(os.path.join(dest, 'time.npy')):
+        with open(os.path.join(dest, 'stations.json'), 'r', encoding='utf-8') as fp:
+            locations = json.load(fp)
+        stations = {loc['name']: i for i, loc in enumerate(locations)}
+        old_times = np.load(os.path.join(dest, 'time.npy'))
+    old_shape = (len(locations), len(old_times))
+    after = to_micros(old_times.max().astype(dt.datetime)) if len(old_times) else None
+
+    times = array('q')
+    t_idx, s_idx = array('q'), array('q')
+    values = {col: array('d') for col in COLUMNS}
+
+    for entry in parse_data(file):
+        # Timestamps are naive local time and are stored as-is
+        micros = to_micros(entry['time'])
+        if after is not None and micros <= after:
+            continue
+        t = len(times)
+        times.append(micros)
+        for loc in entry['location_data']:
+            name = loc['location']['name']
+            if name not in stations:
+                stations[name] = len(locations)
+                locations.append(loc['location'])
+            t_idx.append(t)
+            s_idx.append(stations[name])
+            for col in COLUMNS:
+                val = loc[col]  # type: ignore
+                values[col].append(np.nan if val is None else val)
+
+    if not times and len(old_times):
+        return 0
+
+    shape = (len(locations), old_shape[1] + len(times))
+    ti = np.frombuffer(t_idx, dtype=np.int64) + old_shape[1]
+    si = np.frombuffer(s_idx, dtype=np.int64)
+
+    def save(name: str, data: npt.NDArray[Any]) -> None:
+        pathname = os.path.join(dest, name)
+        with open(pathname + '.tmp', 'wb') as fp:
+            np.save(fp, data)
+        os.replace(pathname + '.tmp', pathname)
+
+    def grown(name: str, fill: Any, dtype: Any) -> npt.NDArray[Any]:
+        column = np.full(shape, fill, dtype=dtype)
+        if old_shape[1]:
+            column[:old_shape[0], :old_shape[1]] = np.load(os.path.join(dest, name))
+        return column
+
+    os.makedirs(dest, exist_ok=True)
+    present = grown('present.npy', False, np.bool_)
+    present[si, ti] = True
+    save('present.npy', present)
+    for col in COLUMNS:
+        column = grown(f'{col}.npy', np.nan, np.float64)
+        column[si, ti] = np.frombuffer(values[col], dtype=np.float64)
+        save(f'{col}.npy', column)
+
+    with open(os.path.join(dest, 'stations.json'), 'w', encoding='utf-8') as fp:
+        json.dump(locations, fp)
+    save('time.npy', np.concatenate(
+        (old_times, np.frombuffer(times, dtype=np.int64).astype('datetime64[us]'))))
+
+    return len(times)
+
+
+def load_columns(store: str, place: str, columns: Iterable[str],
+                 start: dt.time, end: dt.time,
+                 since: dt.datetime | None = None,
+                 until: dt.datetime | None = None,
+                 file: str | None = None
+                 ) -> tuple[npt.NDArray[np.datetime64], dict[str, npt.NDArray[np.float64]]]:
+    """Read the selected columns of one station from a columnar store.
+
+    Only the requested `.npy` files are mapped and only the station's row of
+    each is touched. Entries are kept where the station is present and the
+    time of day lies in [start, end] and the time in [since, until), matching
+    the NDJSON pipeline. If `file` has newer records than the store, a
+    warning says so.
+    """
+    import numpy as np
+    warn_if_stale(store, file)
+    with open(os.path.join(store, 'stations.json'), 'r', encoding='utf-8') as fp:
+        names = [loc['name'] for loc in json.load(fp)]
+
+    times = np.load(os.path.join(store, 'time.npy'), mmap_mode='r')
+    if place not in names:
+        return times[:0], {col: np.zeros(0) for col in columns}
+
+    s = names.index(place)
+    tod = times - times.astype('datetime64[D]')
+    present = np.load(os.path.join(store, 'present.npy'), mmap_mode='r')[s]
+    mask = present & (tod >= time_of_day(start)) & (tod <= time_of_day(end))
+    if since is not None:
+        mask &= times >= np.datetime64(since, 'us')
+    if until is not None:
+        mask &= times < np.datetime64(until, 'us')
+
+    return times[mask], {
+        col: np.load(os.path.join(store, f'{col}.npy'), mmap_mode='r')[s][mask]
+        for col in columns
+    }
+
+
+def aggregate(entries: Iterable[EntryObj]
+              ) -> dict[tuple[str, str, str, str], list[float]]:
+    """Min/max/sum/count per (resolution, bucket, station, field)."""
+    aggr: dict[tuple[str, str, str, str], list[float]] = {}
+    for entry in entries:
+        buckets = [(res, entry['time'].strftime(fmt)) for res, fmt in RESOLUTIONS.items()]
+        for location in entry['location_data']:
+            station = location['location']['name']
+            for field in COLUMNS:
+                val = location[field]  # type: ignore
+                if val is None:
+                    continue
+                for res, bucket in buckets:
+                    acc = aggr.get((res, bucket, station, field))
+                    if acc is None:
+                        aggr[(res, bucket, station, field)] = [val, val, val, 1]
+                    else:
+                        acc[0] = min(acc[0], val)
+                        acc[1] = max(acc[1], val)
+                        acc[2] += val
+                        acc[3] += 1
+
+    return aggr
+
+
+def open_rollups(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS rollup (
+            resolution TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            station TEXT NOT NULL,
+            field TEXT NOT NULL,
+            minimum REAL NOT NULL,
+            maximum REAL NOT NULL,
+            total REAL NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (resolution, bucket, station, field)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """)
+    return conn
+
+
+def update_rollups(conn: sqlite3.Connection, entries: Iterable[EntryObj]) -> int:
+    """Fold entries newer than the last one rolled up into the rollups.
+
+    Older entries are skipped, so feeding the same record twice is harmless.
+    Returns the number of rollup rows touched.
+    """
+    row = conn.execute("SELECT value FROM meta WHERE key = 'last_time'").fetchone()
+    last = dt.datetime.fromisoformat(row[0]) if row else None
+    newest = last
+
+    def fresh() -> Generator[EntryObj, None, None]:
+        nonlocal newest
+        for entry in entries:
+            if last is None or entry['time'] > last:
+                if newest is None or entry['time'] > newest:
+                    newest = entry['time']
+                yield entry
+
+    added = 0
+    with conn:
+        for key, acc in aggregate(fresh()).items():
+            conn.execute("""
+                INSERT INTO rollup VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (resolution, bucket, station, field) DO UPDATE SET
+                    minimum = min(minimum, excluded.minimum),
+                    maximum = max(maximum, excluded.maximum),
+                    total = total + excluded.total,
+                    count = count + excluded.count
+            """, key + tuple(acc))
+            added += 1
+        if newest != last:
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('last_time', ?)", (str(newest),))
+
+    return added
+
+
+def rebuild_rollups(conn: sqlite3.Connection, entries: Iterable[EntryObj]) -> int:
+    with conn:
+        conn.execute('DELETE FROM rollup')
+        conn.execute('DELETE FROM meta')
+
+    return update_rollups(conn, entries)
+
+
+def verify_rollups(conn: sqlite3.Connection, entries: Iterable[EntryObj]
+                   ) -> list[tuple[str, str, str, str]]:
+    """Keys where the stored rollups differ from a full recomputation."""
+    expected = aggregate(entries)
+    stored: dict[tuple[str, str, str, str], list[float]] = {
+        (row[0], row[1], row[2], row[3]): list(row[4:]) for row in conn.execute('SELECT * FROM rollup')}
+
+    bad = list(expected.keys() ^ stored.keys())
+    for key, acc in expected.items():
+        got = stored.get(key)
+        if got is not None and not (got[0] == acc[0] and got[1] == acc[1] and got[3] == acc[3]
+                                    and math.isclose(got[2], acc[2], rel_tol=1e-9, abs_tol=1e-9)):
+            bad.append(key)
+
+    return bad
+
+
+def query_rollups(conn: sqlite3.Connection, place: str, fields: Iterable[str],
+                  resolution: str,
+                  since: dt.datetime | None = None,
+                  until: dt.datetime | None = None,
+                  hours: tuple[dt.time, dt.time] | None = None
+                  ) -> tuple[list[str], dict[str, npt.NDArray[np.float64]]]:
+    """Mean of each field per bucket for one station.
+
+    `hours` only applies to hourly buckets. Buckets missing a field are NaN.
+    """
+    import numpy as np
+    fmt = RESOLUTIONS[resolution]
+    fields = tuple(fields)
+    query = 'SELECT bucket, field, total / count FROM rollup WHERE resolution = ? AND station = ?'
+    params: list[Any] = [resolution, place]
+    if since is not None:
+        query += ' AND bucket >= ?'
+        params.append(since.strftime(fmt))
+    if until is not None:
+        query += ' AND bucket < ?'
+        params.append(until.strftime(fmt))
+
+    means: dict[str, dict[str, float]] = {}
+    for bucket, field, mean in conn.execute(query + ' ORDER BY bucket', params):
+        if hours is not None and resolution == 'hour' \
+                and not hours[0].hour <= int(bucket[-2:]) <= hours[1].hour:
+            continue
+        means.setdefault(bucket, {})[field] = mean
+
+    buckets = list(means)
+    return buckets, {
+        field: np.array([means[bucket].get(field, np.nan) for bucket in buckets])
+        for field in fields
+    }
+
+
+def load_matrix(store: str, places: Iterable[str], columns: Iterable[str],
+                start: dt.time, end: dt.time,
+                since: dt.datetime | None = None,
+                until: dt.datetime | None = None,
+                file: str | None = None
+                ) -> tuple[npt.NDArray[np.datetime64], dict[str, npt.NDArray[np.float64]]]:
+    """`query_matrix` for a columnar store, reading only the requested columns."""
+    import numpy as np
+    warn_if_stale(store, file)
+    with open(os.path.join(store, 'stations.json'), 'r', encoding='utf-8') as fp:
+        names = {loc['name']: i for i, loc in enumerate(json.load(fp))}
+
+    times = np.load(os.path.join(store, 'time.npy'), mmap_mode='r')
+    tod = times - times.astype('datetime64[D]')
+    mask = (tod >= time_of_day(start)) & (tod <= time_of_day(end))
+    if since is not None:
+        mask &= times >= np.datetime64(since, 'us')
+    if until is not None:
+        mask &= times < np.datetime64(until, 'us')
+
+    rows = [names.get(place) for place in places]
+    result = {}
+    for col in columns:
+        data = np.load(os.path.join(store, f'{col}.npy'), mmap_mode='r')
+        result[col] = np.stack([data[s][mask] if s is not None else np.full(mask.sum(), np.nan)
+                                for s in rows])
+
+    return times[mask], result
+
+
 def main() -> None:
+    global METRICS
     args = get_arg_namespace()
+    if args.profile or args.metrics_file:
+        METRICS = Metrics()
+
+    try:
+        run(args)
+    finally:
+        if METRICS is not None and not args.daemon:
+            if args.metrics_file:
+                METRICS.write(args.metrics_file)
+            if args.profile:
+                print(METRICS.render(), end='', file=sys.stderr)
+
+
+def run(args: argparse.Namespace) -> None:
+    if args.fetch or args.daemon:
+        cache = None
+        if not args.no_cache:
+            try:
+                cache = HttpCache(args.cache_dir)
+            except OSError as err:
+                print(f"WARNING: cache disabled: {err}", file=sys.stderr)
+
+        if args.daemon:
+            collect(args.file, args.interval, args.fsync, args.workers, cache, args.rollups,
+                    metrics_file=args.metrics_file, deadline=args.deadline,
+                    timeout=args.timeout, retries=args.retries)
+            return None
+
+        with timed('fetch'):
+            entry = fetch_entry(args.workers, cache=cache, deadline=args.deadline,
+                                timeout=args.timeout, retries=args.retries)
+        if args.cache_stats and cache is not None:
+            print(cache.stats(), file=sys.stderr)
+        with timed('write'):
+            print(format_record(entry))
 
-    if args.fetch:
-        location_data = list(fetch_location_data())
-        print(json.dumps(EntryObj(
-            location_data=location_data,
-            time=str(dt.datetime.now()))))  # type: ignore
+        if args.rollups:
+            with contextlib.closing(open_rollups(args.rollups)) as conn:
+                update_rollups(conn, [entry])
 
         return None
 
-    entries = parse_data(args.file)
-    entries = filter_place(entries, args.place)
-    entries = filter_time_range(entries, dt.time(args.time[0]), dt.time(args.time[1]))
-    ea, eb = itertools.tee(entries)
+    if args.rebuild_rollups or args.verify_rollups:
+        with contextlib.closing(open_rollups(args.rollups or ROLLUPS_FILE)) as conn:
+            if args.rebuild_rollups:
+                count = rebuild_rollups(conn, parse_data(read_lines(args.file)))
+                print(f'Wrote {count} rollup rows')
+            else:
+                bad = verify_rollups(conn, parse_data(read_lines(args.file)))
+                for key in bad:
+                    print(f"ERROR: rollup mismatch {key}", file=sys.stderr)
+                if bad:
+                    exit(1)
+                print('Rollups match data')
+        return None
+
+    if args.convert:
+        # Seek past what the store already has; it skips any overlap
+        count = convert_columnar(read_lines(args.file, since=store_end(args.convert)), args.convert)
+        print(f'Converted {count} entries to `{args.convert}`')
+        return None
+
+    if args.compact:
+        if not os.path.isdir(args.file):
+            count = split_segments(args.file, args.compact)
+            print(f'Split {count} lines from `{args.file}` into `{args.compact}`')
+        for name, before, after in compress_segments(args.compact, dt.date.today().strftime('%Y-%m')):
+            print(f'{name}: {before / 2**20:.1f} MiB -> {after / 2**20:.1f} MiB')
+        sizes = [os.path.getsize(segment) for segment in list_segments(args.compact)]
+        if not os.path.isdir(args.file):
+            print(f'Total: {os.path.getsize(args.file) / 2**20:.1f} MiB -> {sum(sizes) / 2**20:.1f} MiB')
+        return None
+
+    start, end = dt.time(args.time[0]), dt.time(args.time[1])
+    since = until = None
+    if args.date_from:
+        since = dt.datetime.combine(args.date_from, dt.time())
+    if args.date_to:
+        until = dt.datetime.combine(args.date_to + dt.timedelta(days=1), dt.time())
+
+    # Every query path below needs numpy. Its import is a stage of its own,
+    # or it would be charged to whichever stage imports it first (extract)
+    with timed('import'):
+        import numpy  # noqa: F401
+
+    if args.batch:
+        places = tuple(dict.fromkeys(args.places))
+        fields = tuple(dict.fromkeys(args.vars))
+        if args.store:
+            _, columns = load_matrix(args.store, places, ('pm10',) + fields,
+                                     start, end, since, until, args.file)
+        else:
+            lines = measured('read', read_lines(args.file, since, until))
+            entries = measured('parse', parse_data(lines, hours=(start, end)))
+            entries = measured('filter_date', filter_date_range(entries, since, until))
+            entries = measured('filter_time', filter_time_range(entries, start, end))
+            with timed('extract', pipeline=True):
+                _, columns = query_matrix(entries, places, ('pm10',) + fields)
+
+        summary = summarise(places, fields, columns)
+        if args.format == 'json':
+            print(json.dumps(summary))
+        else:
+            print_summary(summary)
 
-    pm10 = tuple(extract_entries_field(ea, args.place, 'pm10'))
-    cmp = tuple(extract_entries_field(eb, args.place, args.var))
+        if args.plot or args.output:
+            import numpy as np
+            plt = pyplot(args.output)
+            corr = np.array([summary['corr_pm10'][var] for var in fields], dtype=np.float64).T
+            fig, ax = plt.subplots()
+            img = ax.imshow(corr, cmap='coolwarm', vmin=-1, vmax=1)
+            ax.set_xticks(np.arange(len(fields)), fields)
+            ax.set_yticks(np.arange(len(places)), places)
+            ax.set_title('Correlation with pm10')
+            fig.colorbar(img, ax=ax)
+            if args.output:
+                fig.savefig(args.output)
+            else:
+                plt.show()
 
+        return None
+
+    if args.resolution:
+        with contextlib.closing(open_rollups(args.rollups or ROLLUPS_FILE)) as conn:
+            _, columns = query_rollups(conn, args.place, ('pm10', args.var), args.resolution,
+                                       since, until, (start, end))
+    elif args.store:
+        _, columns = load_columns(args.store, args.place, ('pm10', args.var),
+                                  start, end, since, until, args.file)
+    else:
+        lines = measured('read', read_lines(args.file, since, until))
+        entries = measured('parse', parse_data(lines, args.place, (start, end)))
+        entries = measured('filter_date', filter_date_range(entries, since, until))
+        entries = measured('filter_time', filter_time_range(entries, start, end))
+        with timed('extract', pipeline=True):
+            _, columns = query_fields(entries, args.place, ('pm10', args.var))
+
+    pm10, cmp = columns['pm10'], columns[args.var]
     print(args.place)
+    with timed('plot'):
+        plot(args, pm10, cmp)
+
+
+def plot(args: argparse.Namespace, pm10: npt.NDArray[np.float64], cmp: npt.NDArray[np.float64]) -> None:
+    import numpy as np
+    plt = pyplot(args.output)
+
     size = len(pm10)
     x = np.arange(size)
     fig, ax = plt.subplots()
@@ -210,9 +1594,10 @@ def main() -> None:
     ax.set_label(args.place)
     ax.legend('pm10', args.var, loc='upper left')
     ax.bar(x - 0.2, cmp, width=0.4, color='#f7a8b8')
-    plt.show()
-
-    return None
+    if args.output:
+        fig.savefig(args.output)
+    else:
+        plt.show()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,5 @@
+#!/usr/bin/env bash
+
+# Fetch tests against stand-in APIs on 127.0.0.1, no network needed
+cd "$(dirname "$0")" || exit 1
+python3 -m unittest test_climate_data.py
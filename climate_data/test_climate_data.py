@@ -0,0 +1,192 @@
+#!/usr/bin/env python3.10
+"""Fetch tests against stand-in NILU and met.no APIs on 127.0.0.1."""
+
+import glob
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+import climate_data as cd
+
+LATENCY = 0.3
+DEADLINE = 1.0
+INTERVAL = 0.3
+
+# collect() until SIGTERM, then print how many records it wrote
+COLLECT = '''
+import sys, climate_data
+print(climate_data.collect(sys.argv[1], float(sys.argv[2]), nilu_url=sys.argv[3], met_url=sys.argv[4]))
+'''
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server: 'StubServer'
+
+    def log_message(self, format: str, *args: Any) -> None:
+        return None
+
+    def do_GET(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == '/nilu':
+            self.reply(200, self.server.stations if self.server.nilu is None else self.server.nilu)
+            return None
+
+        lat = dict(urllib.parse.parse_qsl(url.query))['lat']
+        fault = self.server.faults.get(lat)
+        if fault == 'stuck':
+            self.server.released.wait()
+        time.sleep(self.server.latency)
+        if isinstance(fault, int):
+            self.reply(fault, {})
+            return None
+        self.reply(200, {'properties': {'timeseries': [{'data': {'instant': {'details': {
+            'air_temperature': float(lat),
+            'air_pressure_at_sea_level': 1010.0,
+            'relative_humidity': 50.0,
+            'cloud_area_fraction': 20.0,
+            'wind_speed': 3.0,
+        }}}}]}})
+
+        return None
+
+    def reply(self, status: int, data: Any) -> None:
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up on it
+
+        return None
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Every station connects at once; past the default backlog of 5 the
+    # kernel drops the SYN and the client retries a second later
+    request_queue_size = 64
+
+    def __init__(self, latency: float) -> None:
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.latency = latency  # of every met.no request
+        # One grid point per station, so every one is its own request
+        self.stations = [{'station': place, 'latitude': 59.9 + i / 100,
+                          'longitude': 10.7 + i / 100, 'value': float(i)}
+                         for i, place in enumerate(cd.PLACES)]
+        self.nilu: Any = None  # served instead of the stations when set
+        # Latitude as met.no is asked for it -> 'stuck' or an HTTP status
+        self.faults: dict[str, str | int] = {}
+        self.released = threading.Event()
+
+    def fault(self, station: int, fault: str | int) -> str:
+        """Make a station's forecast fail, returns the station's name."""
+        place = self.stations[station]
+        self.faults[f'{place["latitude"]:.{cd.MET_COORD_DECIMALS}f}'] = fault
+        return str(place['station'])
+
+    @property
+    def nilu_url(self) -> str:
+        return f'http://127.0.0.1:{self.server_port}/nilu'
+
+    @property
+    def met_url(self) -> str:
+        return f'http://127.0.0.1:{self.server_port}/met?lat={{}}&lon={{}}'
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = StubServer(LATENCY)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self) -> None:
+        self.server.released.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_fetch_concurrent(self) -> None:
+        # All stations at once take about as long as the slowest, not 14 times it
+        start = time.perf_counter()
+        entry = cd.fetch_entry(nilu_url=self.server.nilu_url, met_url=self.server.met_url)
+        elapsed = time.perf_counter() - start
+
+        self.assertLess(elapsed, 2 * LATENCY)
+        self.assertEqual([d['location']['name'] for d in entry['location_data']],
+                         [s['station'] for s in self.server.stations])
+        self.assertNotIn('stale', entry)
+
+    def test_fetch_deadline(self) -> None:
+        stale = [self.server.fault(3, 'stuck'), self.server.fault(7, 503)]
+        start = time.perf_counter()
+        entry = cd.fetch_entry(nilu_url=self.server.nilu_url, met_url=self.server.met_url,
+                               deadline=DEADLINE, timeout=DEADLINE / 2)
+        elapsed = time.perf_counter() - start
+
+        self.assertLess(elapsed, DEADLINE + 0.3)
+        self.assertEqual(entry.get('stale'), stale)
+        self.assertEqual(len(entry['location_data']), len(cd.PLACES) - len(stale))
+
+    def test_fetch_nilu_down(self) -> None:
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            closed = f'http://127.0.0.1:{sock.getsockname()[1]}/nilu'
+
+        start = time.perf_counter()
+        entry = cd.fetch_entry(nilu_url=closed, met_url=self.server.met_url,
+                               deadline=DEADLINE, timeout=DEADLINE / 2)
+        elapsed = time.perf_counter() - start
+
+        self.assertLess(elapsed, DEADLINE + 0.3)
+        self.assertEqual(entry['location_data'], [])
+        self.assertEqual(entry.get('stale'), list(cd.PLACES))
+
+    def test_fetch_nilu_malformed(self) -> None:
+        broken = dict(self.server.stations[0])
+        del broken['latitude']
+        for body in ({}, {'error': 'down'}, [], [broken], self.server.stations + [None]):
+            with self.subTest(body=body):
+                self.server.nilu = body
+                entry = cd.fetch_entry(nilu_url=self.server.nilu_url, met_url=self.server.met_url,
+                                       deadline=DEADLINE, timeout=DEADLINE / 2)
+                self.assertEqual(entry['location_data'], [])
+                self.assertEqual(entry.get('stale'), list(cd.PLACES))
+
+    def test_collect_sigterm(self) -> None:
+        self.server.latency = 0.05
+        with tempfile.TemporaryDirectory() as path:
+            proc = subprocess.Popen([sys.executable, '-c', COLLECT, path, str(INTERVAL),
+                                     self.server.nilu_url, self.server.met_url],
+                                    stdout=subprocess.PIPE, text=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__)))
+            time.sleep(1.5)
+            proc.send_signal(signal.SIGTERM)
+            out, _ = proc.communicate(timeout=DEADLINE + 5)
+
+            self.assertEqual(proc.returncode, 0)
+            lines = []
+            for segment in glob.glob(os.path.join(path, '*.json')):
+                with open(segment, 'r', encoding='utf-8') as fp:
+                    lines += fp.read().splitlines()
+            records = [json.loads(line) for line in lines]
+
+        self.assertGreater(len(records), 0)
+        self.assertEqual(int(out), len(records))
+        for record in records:
+            self.assertEqual(len(record['location_data']), len(cd.PLACES))
+
+
+if __name__ == '__main__':
+    unittest.main()
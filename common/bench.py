@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""Benchmark `textdata.load_table` against reading line by line.
+
+Generates multi-megabyte files shaped like power-prices/data.txt (yr
+monthly weather, whitespace separated) and valgdeltagelse.txt (`;`
+separated), optionally with a malformed line at the end like the real
+data.txt has.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+
+import numpy as np
+import numpy.typing as npt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from common.textdata import load_table  # noqa: E402
+from common.timing import add_repeat_argument, best_of  # noqa: E402
+
+WEATHER_DTYPE = [('day', 'f4'), ('min', 'f4'), ('max', 'f4'), ('mean', 'f4')]
+VOTE_DTYPE = [('year', 'i4'), ('vote', 'f4')]
+
+
+def comma(value: float) -> str:
+    return f'{value:.1f}'.replace('.', ',')
+
+
+def generate_weather(path: str, size: int, malformed: bool, seed: int = 0) -> int:
+    rnd = random.Random(seed)
+    rows = 0
+    with open(path, 'w', encoding='utf-8') as fp:
+        while fp.tell() < size:
+            rows += 1
+            low = rnd.gauss(-3, 5)
+            high = low + rnd.uniform(0, 8)
+            snow = '–' if rnd.random() < 0.7 else comma(rnd.uniform(0, 40))
+            print(f'{rows}. {comma(low)}°\t{comma(high)}°\t{comma((low + high) / 2)}°\t'
+                  f'{comma(rnd.gauss(-2, 1))}°\t{comma(rnd.expovariate(1))}\t{snow}\t'
+                  f'{comma(rnd.uniform(0, 8))}\t{comma(rnd.uniform(2, 20))}', file=fp)
+        if malformed:
+            rows += 1
+            print(f'{rows}. foo bar 3,6°', file=fp)
+    return rows
+
+
+def generate_votes(path: str, size: int, malformed: bool, seed: int = 0) -> int:
+    rnd = random.Random(seed)
+    rows = 0
+    with open(path, 'w', encoding='utf-8', newline='') as fp:
+        while fp.tell() < size:
+            rows += 1
+            fp.write(f'{1945 + rows};{comma(rnd.uniform(50, 90))}\r\n')
+        if malformed:
+            rows += 1
+            fp.write(f'{1945 + rows};ukjent\r\n')
+    return rows
+
+
+def weather_lines(path: str) -> npt.NDArray[np.void]:
+    """What the scripts did before, readline and split per line."""
+    rows = []
+    with open(path, 'r', encoding='utf-8') as fp:
+        for line in fp:
+            fields = line.replace(',', '.').replace('°', '').split()
+            row = []
+            for field in fields[:4]:
+                try:
+                    row.append(float(field))
+                except ValueError:
+                    row.append(np.nan)
+            rows.append(tuple(row + [np.nan] * (4 - len(row))))
+    return np.array(rows, dtype=WEATHER_DTYPE)
+
+
+def vote_lines(path: str) -> npt.NDArray[np.void]:
+    rows = []
+    with open(path, 'r', encoding='utf-8') as fp:
+        for line in fp:
+            line = line.strip().replace(',', '.')
+            try:
+                vote = float(line.split(';')[1])
+            except ValueError:
+                vote = np.nan
+            rows.append((int(line.split(';')[0]), vote))
+    return np.array(rows, dtype=VOTE_DTYPE)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the Norwegian text table loader')
+    parser.add_argument('-s', '--size',
+                        type=int,
+                        default=8,
+                        help='megabytes per generated file')
+    add_repeat_argument(parser, 3)
+    args = parser.parse_args()
+
+    cases = (
+        ('weather', generate_weather, weather_lines,
+         lambda path: load_table(path, WEATHER_DTYPE, usecols=(0, 1, 2, 3))),
+        ('votes', generate_votes, vote_lines,
+         lambda path: load_table(path, VOTE_DTYPE, delimiter=';')),
+    )
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, generate, lines, bulk in cases:
+            for malformed in (False, True):
+                path = os.path.join(tmp, f'{name}.txt')
+                rows = generate(path, args.size * 2**20, malformed)
+                megabytes = os.path.getsize(path) / 2**20
+
+                line_s, expected = best_of(args.repeat, lambda: lines(path))
+                bulk_s, got = best_of(args.repeat, lambda: bulk(path))
+                assert len(got) == rows and all(
+                    np.array_equal(got[f], expected[f], equal_nan=True) for f in got.dtype.names), \
+                    f'{name}: load_table disagrees with reading line by line'
+
+                results.append({
+                    'file': name,
+                    'malformed': malformed,
+                    'rows': rows,
+                    'megabytes': round(megabytes, 1),
+                    'lines_s': line_s,
+                    'load_table_s': bulk_s,
+                    'load_table_mb_per_s': megabytes / bulk_s,
+                    'speedup': line_s / bulk_s,
+                })
+                print(f"{name}{' (malformed)' if malformed else ''}: "
+                      f'{line_s:.2f} s by line, {bulk_s:.2f} s load_table', file=sys.stderr)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
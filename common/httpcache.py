@@ -0,0 +1,127 @@
+"""Conditional GETs of JSON APIs through an on-disk cache.
+
+met.no asks clients to honour `Expires` and to revalidate with
+`If-Modified-Since` after it, which the scripts calling it do through
+`get_json`. requests and email.utils are imported where they are used, so
+importing this costs the scripts' fast paths nothing.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    import requests as req
+
+
+class HttpCache:
+    """On-disk response cache honoring Expires and Last-Modified headers.
+
+    One JSON file per url, named by its hash unless the caller names it.
+    Counters are kept so a fetch can report how many round trips were saved.
+    """
+
+    def __init__(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.hits = 0         # fresh on disk, no request sent
+        self.revalidated = 0  # 304 Not Modified
+        self.misses = 0       # full response downloaded
+        self.lock = threading.Lock()
+
+    def _pathname(self, url: str, name: str | None) -> str:
+        if name is None:
+            name = hashlib.sha1(url.encode()).hexdigest()
+        return os.path.join(self.path, name + '.json')
+
+    def load(self, url: str, name: str | None = None) -> dict[str, Any] | None:
+        try:
+            with open(self._pathname(url, name), 'r', encoding='utf-8') as fp:
+                entry: dict[str, Any] = json.load(fp)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get('url') == url else None
+
+    def store(self, url: str, data: Any, headers: Any,
+              last_modified: str | None = None, name: str | None = None) -> None:
+        import email.utils
+        expires = 0.0
+        if 'Expires' in headers:
+            try:
+                expires = email.utils.parsedate_to_datetime(headers['Expires']).timestamp()
+            except (TypeError, ValueError):
+                pass
+
+        entry = {
+            'url': url,
+            'expires': expires,
+            'last_modified': headers.get('Last-Modified', last_modified),
+            'data': data,
+        }
+        pathname = self._pathname(url, name)
+        tmp = f'{pathname}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as fp:
+                json.dump(entry, fp)
+            os.replace(tmp, pathname)
+        except OSError:
+            pass  # a cache that cannot be written is just a slower cache
+
+    def count(self, kind: str) -> None:
+        with self.lock:
+            setattr(self, kind, getattr(self, kind) + 1)
+
+    def stats(self) -> str:
+        return f'cache: hits={self.hits} revalidated={self.revalidated} misses={self.misses}'
+
+
+def make_session(workers: int, hosts: int = 1) -> req.Session:
+    """Session with a keep-alive pool per host large enough for every worker."""
+    import requests as req
+    session = req.Session()
+    adapter = req.adapters.HTTPAdapter(pool_connections=hosts, pool_maxsize=max(workers, 1))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_json(url: str, headers: dict[str, str],
+             session: req.Session | None = None,
+             cache: HttpCache | None = None,
+             timeout: float | None = None,
+             name: str | None = None) -> Any:
+    """GET `url` as JSON, from `cache` while it is fresh.
+
+    A stale entry is revalidated; anything but 200 or 304 raises
+    `requests.HTTPError`. `name` is the entry's file name in the cache.
+    """
+    import requests as req
+    entry = None
+    if cache is not None:
+        entry = cache.load(url, name)
+        if entry is not None and entry['expires'] > time.time():
+            cache.count('hits')
+            return entry['data']
+        if entry is not None and entry['last_modified']:
+            headers = {**headers, 'If-Modified-Since': entry['last_modified']}
+
+    res = (session or req).get(url, headers=headers, timeout=timeout)
+    if cache is not None and entry is not None and res.status_code == 304:
+        cache.count('revalidated')
+        cache.store(url, entry['data'], res.headers, entry['last_modified'], name)
+        return entry['data']
+
+    if res.status_code != 200:
+        raise req.HTTPError(f'status {res.status_code} from `{url}`', response=res)
+
+    data = json.loads(res.text)
+    if cache is not None:
+        cache.count('misses')
+        cache.store(url, data, res.headers, name=name)
+
+    return data
@@ -0,0 +1,12 @@
+"""matplotlib helpers shared by the plotting scripts."""
+
+from typing import Any
+
+
+def pyplot(output: str | None) -> Any:
+    """Import pyplot, on the headless Agg backend when rendering to a file."""
+    if output:
+        import matplotlib
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+"""Render a manifest of charts to files, in parallel on the Agg backend.
+
+A chart is a script with a `chart(plt, **options)` that builds and returns
+a figure, as power-prices, valgdeltagelse, media-usage and
+tests/2023-03-20/oppg2 have. The manifest is a JSON list of
+
+    {"script": "../valgdeltagelse/main.py", "output": "valg.png",
+     "options": {}}
+
+with `script` relative to the manifest and `output` to --out-dir. The
+format follows the output's extension.
+
+Every worker process imports matplotlib once, then imports each script
+the first time one of its charts comes up and keeps it. A chart is built
+with the working directory set to its script's, so the scripts' relative
+data files are found.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, NamedTuple
+
+MANIFEST_F_NAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'charts.json')
+DPI = 100
+
+
+class Task(NamedTuple):
+    script: str
+    output: str
+    options: dict[str, Any]
+
+
+# Per worker process
+_plt: Any = None
+_scripts: dict[str, Any] = {}
+
+
+def read_manifest(pathname: str, out_dir: str) -> list[Task]:
+    with open(pathname, 'r', encoding='utf-8') as fp:
+        entries = json.load(fp)
+    if not isinstance(entries, list):
+        raise ValueError('manifest has to be a list of charts')
+
+    base = os.path.dirname(os.path.abspath(pathname))
+    tasks = []
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, dict) or 'script' not in entry or 'output' not in entry:
+            raise ValueError(f'chart {i} needs a `script` and an `output`')
+        options = entry.get('options', {})
+        if not isinstance(options, dict):
+            raise ValueError(f'chart {i}: `options` has to be an object')
+        tasks.append(Task(os.path.join(base, entry['script']),
+                          os.path.abspath(os.path.join(out_dir, entry['output'])), options))
+
+    return tasks
+
+
+def init_worker() -> None:
+    """Import pyplot on Agg, and draw once so the fonts are loaded."""
+    global _plt
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    plt.figure().canvas.draw()
+    plt.close('all')
+    _plt = plt
+
+    return None
+
+
+def load_script(pathname: str) -> Any:
+    script = _scripts.get(pathname)
+    if script is not None:
+        return script
+
+    # The scripts are all main.py, so each gets a name of its own. Their
+    # directory is on the path while importing, for modules next to them
+    directory = os.path.dirname(pathname)
+    spec = importlib.util.spec_from_file_location(f'chart_{len(_scripts)}', pathname)
+    if spec is None or spec.loader is None:
+        raise ImportError(f'can not import {pathname}')
+    script = importlib.util.module_from_spec(spec)
+    sys.path.insert(0, directory)
+    try:
+        spec.loader.exec_module(script)
+    finally:
+        sys.path.remove(directory)
+    if not hasattr(script, 'chart'):
+        raise ImportError(f'{pathname} has no chart()')
+
+    _scripts[pathname] = script
+    return script
+
+
+def render(task: Task, dpi: int) -> float:
+    """Build and save one chart, returns the seconds it took."""
+    start = time.perf_counter()
+    script = load_script(task.script)
+    cwd = os.getcwd()
+    os.chdir(os.path.dirname(task.script))
+    try:
+        fig = script.chart(_plt, **task.options)
+        fig.savefig(task.output, dpi=dpi)
+    finally:
+        _plt.close('all')
+        os.chdir(cwd)
+
+    return time.perf_counter() - start
+
+
+def render_all(tasks: list[Task], workers: int, dpi: int) -> dict[str, float | Exception]:
+    """Seconds per output, or what went wrong with it."""
+    results: dict[str, float | Exception] = {}
+    for output in {os.path.dirname(task.output) for task in tasks}:
+        os.makedirs(output, exist_ok=True)
+
+    if workers == 1:
+        init_worker()
+        for task in tasks:
+            try:
+                results[task.output] = render(task, dpi)
+            except Exception as err:
+                results[task.output] = err
+        return results
+
+    with ProcessPoolExecutor(workers, initializer=init_worker) as pool:
+        futures = {pool.submit(render, task, dpi): task for task in tasks}
+        for future in as_completed(futures):
+            try:
+                results[futures[future].output] = future.result()
+            except Exception as err:
+                results[futures[future].output] = err
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Render charts to files in parallel')
+    parser.add_argument('manifest',
+                        nargs='?',
+                        type=str,
+                        default=MANIFEST_F_NAME,
+                        help='JSON list of charts (default common/charts.json)')
+    parser.add_argument('-o', '--out-dir',
+                        type=str,
+                        default='.',
+                        required=False,
+                        help='directory the outputs are relative to (default .)')
+    parser.add_argument('-j', '--workers',
+                        type=int,
+                        default=os.cpu_count() or 1,
+                        required=False,
+                        help='worker processes (default one per core)')
+    parser.add_argument('--dpi',
+                        type=int,
+                        default=DPI,
+                        required=False,
+                        help=f'resolution of raster outputs (default {DPI})')
+    parser.add_argument('-t', '--times',
+                        action='store_true',
+                        help='print the seconds of every chart and the total')
+    args = parser.parse_args()
+
+    if args.workers < 1 or args.dpi < 1:
+        print("ERROR: --workers and --dpi have to be at least 1", file=sys.stderr)
+        exit(1)
+
+    try:
+        tasks = read_manifest(args.manifest, args.out_dir)
+    except (OSError, ValueError) as err:
+        print(f"ERROR: could not read manifest: {err}", file=sys.stderr)
+        exit(1)
+
+    start = time.perf_counter()
+    results = render_all(tasks, min(args.workers, len(tasks)) or 1, args.dpi)
+    wall = time.perf_counter() - start
+
+    failed = False
+    for task in tasks:
+        result = results[task.output]
+        if isinstance(result, Exception):
+            print(f"ERROR: {task.output}: {type(result).__name__}: {result}", file=sys.stderr)
+            failed = True
+        elif args.times:
+            print(f"{result:7.3f} s  {os.path.relpath(task.output)}")
+    if args.times:
+        print(f"{wall:7.3f} s  {len(tasks)} charts, {args.workers} workers")
+
+    if failed:
+        exit(1)
+
+    return None
+
+
+if __name__ == '__main__':
+    main()
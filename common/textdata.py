@@ -0,0 +1,116 @@
+"""Bulk loader for numeric text files written the Norwegian way.
+
+Tables copied from Norwegian sites (yr, SSB, valgresultat) use decimal
+commas, put `°` after temperatures and `–` in empty cells. `load_table`
+reads such a file into a NumPy structured array in one pass of the C
+parser in `np.loadtxt`, whatever its length, with `–` as NaN.
+
+The decimal comma means `,` can not also be the delimiter.
+"""
+
+import io
+import re
+
+import numpy as np
+import numpy.typing as npt
+
+# Applied to the whole text before parsing
+REPLACEMENTS = (
+    ('\r', ''),
+    (',', '.'),
+    ('°', ''),
+    ('−', '-'),    # minus sign
+    ('–', 'nan'),  # en dash, an empty cell
+)
+
+NUMBER = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|[-+]?(?:nan|inf)'
+
+
+def normalize(text: str) -> str:
+    for old, new in REPLACEMENTS:
+        text = text.replace(old, new)
+    return text
+
+
+def _invalid_field(delimiter: str | None) -> re.Pattern[str]:
+    """Matches the fields of a line that are not a number."""
+    if delimiter is None:
+        return re.compile(rf'(?<!\S)(?!(?:{NUMBER})(?!\S))\S+', re.IGNORECASE)
+    sep = re.escape(delimiter)
+    return re.compile(rf'(?:(?<={sep})|^)(?!\s*(?:{NUMBER})\s*(?:{sep}|$))[^{sep}\n]+',
+                      re.IGNORECASE | re.MULTILINE)
+
+
+def _scrub(text: str, delimiter: str | None) -> str:
+    """`text` with the fields that are no number replaced by nan. Only lines
+    with a character no number can have are looked at.
+    """
+    field = _invalid_field(delimiter)
+    suspect = re.compile(rf'[^0-9.eEnNaAiIfF+\-\s{re.escape(delimiter or "")}]')
+    parts = []
+    pos = 0
+    while (m := suspect.search(text, pos)):
+        start = text.rfind('\n', 0, m.start()) + 1
+        end = text.find('\n', m.start())
+        end = len(text) if end == -1 else end
+        parts += [text[pos:start], field.sub('nan', text[start:end])]
+        pos = end
+    parts.append(text[pos:])
+
+    return ''.join(parts)
+
+
+def _float(field: str) -> float:
+    try:
+        return float(field)
+    except ValueError:
+        return np.nan
+
+
+def _parse_ragged(text: str, dtype: npt.DTypeLike, delimiter: str | None,
+                  usecols: tuple[int, ...] | None) -> npt.NDArray[np.void]:
+    """Line by line, padding short lines with NaN. Only used when
+    `np.loadtxt` gives up on a file even after bad fields became NaN.
+    """
+    dt = np.dtype(dtype)
+    lines = [line.split(delimiter) for line in text.split('\n') if line.strip()]
+    if usecols is not None:
+        cols = usecols
+    elif dt.names:
+        cols = tuple(range(len(dt.names)))
+    else:
+        cols = tuple(range(max(map(len, lines), default=0)))
+    rows = [tuple(_float(fields[c]) if c < len(fields) else np.nan for c in cols)
+            for fields in lines]
+
+    return np.array(rows, dtype=dt)
+
+
+def load_table(pathname: str, dtype: npt.DTypeLike,
+               delimiter: str | None = None,
+               usecols: tuple[int, ...] | None = None,
+               skiprows: int = 0) -> npt.NDArray[np.void]:
+    """Read a Norwegian formatted table into an array of `dtype`.
+
+    `dtype` is normally structured, one field per used column. Fields are
+    split on `delimiter`, or on any whitespace if None. Fields that are no
+    number at all, like a stray word, are read as NaN, and so are missing
+    fields of short lines.
+    """
+    with open(pathname, 'r', encoding='utf-8') as fp:
+        text = normalize(fp.read())
+
+    try:
+        return np.loadtxt(io.StringIO(text), dtype=dtype, delimiter=delimiter,
+                          usecols=usecols, skiprows=skiprows, ndmin=1)
+    except ValueError:
+        pass
+
+    # Scrub the lines with bad fields, and only then go line by line
+    lines = text.split('\n', skiprows)
+    body = _scrub(lines[-1], delimiter) if len(lines) > skiprows else ''
+    try:
+        return np.loadtxt(io.StringIO(body), dtype=dtype, delimiter=delimiter,
+                          usecols=usecols, ndmin=1)
+    except ValueError:
+        return _parse_ragged(body, dtype, delimiter, usecols)
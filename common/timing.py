@@ -0,0 +1,25 @@
+"""Timing helpers shared by the bench scripts, so they all measure the same way."""
+
+import argparse
+import time
+from collections.abc import Callable
+from typing import Any
+
+
+def best_of(repeat: int, func: Callable[[], Any]) -> tuple[float, Any]:
+    """Fastest of `repeat` runs of `func` in seconds, and what it returned."""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def add_repeat_argument(parser: argparse.ArgumentParser, default: int) -> None:
+    """The -n/--repeat option `best_of` takes its runs from."""
+    parser.add_argument('-n', '--repeat',
+                        type=int,
+                        default=default,
+                        help=f'runs per measurement, the fastest is reported (default {default})')
+    return None
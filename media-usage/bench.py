@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""Per-frame render time of the media-usage animation on the Agg backend.
+
+`rebuild` is how main.py used to draw a frame: clear the axes and make the
+bars, grid and labels again, then draw the whole figure. `in_place` sets
+the bar heights of bars made once and redraws the whole figure, as
+`anim.save` does. `blit` restores the background and draws only the
+bars, their baseline and the year label, as the window and the
+video export do.
+"""
+
+import argparse
+import json
+import platform
+import time
+from collections.abc import Callable
+from typing import Any
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+
+import main as mu  # noqa: E402
+
+
+def per_frame(frames: int, draw: Callable[[int], Any]) -> dict[str, float]:
+    draw(0)  # fonts and caches
+    times = np.empty(frames)
+    for frame in range(frames):
+        start = time.perf_counter()
+        draw(frame)
+        times[frame] = time.perf_counter() - start
+    return {'mean_ms': float(times.mean() * 1e3), 'median_ms': float(np.median(times) * 1e3),
+            'max_ms': float(times.max() * 1e3)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark media-usage frame rendering')
+    parser.add_argument('-s', '--steps',
+                        type=int,
+                        default=mu.FRAMES_PER_YEAR,
+                        help='frames per year')
+    args = parser.parse_args()
+
+    categories, years, minutes = mu.load_usage(mu.DATAF_F_NAME)
+    labels, heights = mu.interpolate(years, minutes, args.steps)
+    frames = len(heights)
+
+    fig, ax = plt.subplots()
+
+    def rebuild(frame: int) -> None:
+        ax.clear()
+        ax.grid(axis='y')
+        ax.bar(categories, heights[frame])
+        ax.set_ylabel('Bruk in minutter')
+        ax.set_ylim((0, 250))
+        ax.set_title(f'År: {labels[frame]}')
+        fig.canvas.draw()
+
+    results = {'rebuild': per_frame(frames, rebuild)}
+    plt.close(fig)
+
+    fig, ax, bars, label = mu.make_figure(plt, categories)
+    update = mu.frame_updater(ax, bars, label, labels, heights)
+    artists = update(0)
+
+    def in_place(frame: int) -> None:
+        update(frame)
+        fig.canvas.draw()
+
+    for artist in artists:
+        artist.set_animated(False)
+    results['in_place'] = per_frame(frames, in_place)
+
+    for artist in artists:
+        artist.set_animated(True)
+    fig.canvas.draw()
+    background = fig.canvas.copy_from_bbox(fig.bbox)
+
+    def blit(frame: int) -> None:
+        fig.canvas.restore_region(background)
+        for artist in update(frame):
+            ax.draw_artist(artist)
+        fig.canvas.blit(fig.bbox)
+
+    results['blit'] = per_frame(frames, blit)
+    plt.close(fig)
+
+    print(json.dumps({
+        'python': platform.python_version(),
+        'matplotlib': matplotlib.__version__,
+        'frames': frames,
+        'per_frame': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
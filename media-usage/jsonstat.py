@@ -0,0 +1,156 @@
+"""JSON-stat reader, as served by SSB's statistikkbanken.
+
+A dataset becomes a `Cube`: its values as an N-dimensional masked array,
+one axis per dimension in `id` order, with the category codes and labels
+of every axis. Missing values (null, or absent from a sparse `value`
+object) are masked, never zero. Both JSON-stat 1.0 bundles (`{"dataset":
+{...}}`, as SSB sends) and 2.0 datasets are read.
+"""
+
+import json
+from collections.abc import Sequence
+from typing import Any, NamedTuple
+
+import numpy as np
+import numpy.typing as npt
+
+
+class Dimension(NamedTuple):
+    id: str
+    label: str
+    codes: tuple[str, ...]
+    labels: tuple[str, ...]
+
+
+class Cube:
+    """Masked values with labelled axes. Selections are slices of `data`."""
+
+    def __init__(self, data: np.ma.MaskedArray[Any, np.dtype[np.float64]],
+                 dimensions: Sequence[Dimension], label: str = '') -> None:
+        if data.ndim != len(dimensions):
+            raise ValueError(f'{data.ndim} axes but {len(dimensions)} dimensions')
+        self.data = data
+        self.dimensions = tuple(dimensions)
+        self.label = label
+        self._positions = {d.id: {code: i for i, code in enumerate(d.codes)} for d in dimensions}
+
+    def __repr__(self) -> str:
+        shape = ', '.join(f'{d.id}={len(d.codes)}' for d in self.dimensions)
+        return f'Cube({shape})'
+
+    @property
+    def ids(self) -> tuple[str, ...]:
+        return tuple(d.id for d in self.dimensions)
+
+    def axis(self, dim: str) -> int:
+        try:
+            return self.ids.index(dim)
+        except ValueError:
+            raise KeyError(f'no dimension `{dim}`, have {", ".join(self.ids)}') from None
+
+    def dimension(self, dim: str) -> Dimension:
+        return self.dimensions[self.axis(dim)]
+
+    def position(self, dim: str, code: str) -> int:
+        try:
+            return self._positions[dim][code]
+        except KeyError:
+            raise KeyError(f'no category `{code}` in dimension `{dim}`') from None
+
+    def sel(self, **selection: str | Sequence[str]) -> 'Cube':
+        """Pick categories by code. A single code drops the axis, a list
+        of codes keeps it in the order given.
+        """
+        index: list[Any] = [slice(None)] * self.data.ndim
+        dimensions: list[Dimension | None] = list(self.dimensions)
+        for dim, codes in selection.items():
+            axis = self.axis(dim)
+            d = self.dimensions[axis]
+            if isinstance(codes, str):
+                index[axis] = self.position(dim, codes)
+                dimensions[axis] = None
+            else:
+                picks = [self.position(dim, code) for code in codes]
+                index[axis] = picks
+                dimensions[axis] = Dimension(d.id, d.label, tuple(d.codes[i] for i in picks),
+                                             tuple(d.labels[i] for i in picks))
+
+        # Several lists would index jointly, so take one axis at a time
+        data = self.data
+        for axis in reversed(range(len(index))):
+            if not isinstance(index[axis], slice):
+                data = data[(slice(None),) * axis + (index[axis],)]
+
+        return Cube(data, [d for d in dimensions if d is not None], self.label)
+
+    def squeeze(self) -> 'Cube':
+        """Drop the axes with a single category, like SSB's content codes."""
+        keep = [i for i, d in enumerate(self.dimensions) if len(d.codes) != 1]
+        data = self.data.reshape([len(self.dimensions[i].codes) for i in keep])
+        return Cube(data, [self.dimensions[i] for i in keep], self.label)
+
+    def reduce(self, dim: str, how: str = 'mean') -> 'Cube':
+        """Sum, mean, min or max over a dimension, ignoring masked values."""
+        axis = self.axis(dim)
+        data = getattr(self.data, how)(axis=axis)
+        return Cube(np.ma.asarray(data), self.dimensions[:axis] + self.dimensions[axis + 1:],
+                    self.label)
+
+
+def _dimension(dim_id: str, obj: dict[str, Any], size: int) -> Dimension:
+    category = obj.get('category', {})
+    index = category.get('index')
+    names = category.get('label', {})
+    if index is None:
+        # Only allowed with a single category, then label has it
+        codes = list(names)
+    elif isinstance(index, list):
+        codes = index
+    else:
+        codes = [''] * len(index)
+        for code, i in index.items():
+            codes[i] = code
+
+    if len(codes) != size:
+        raise ValueError(f'dimension `{dim_id}` has {len(codes)} categories, size says {size}')
+
+    return Dimension(dim_id, obj.get('label', dim_id), tuple(codes),
+                     tuple(names.get(code, code) for code in codes))
+
+
+def _values(value: Any, count: int) -> npt.NDArray[np.float64]:
+    if isinstance(value, dict):
+        # Sparse: {"position": value}, the rest is missing
+        data = np.full(count, np.nan)
+        positions = np.fromiter(value.keys(), dtype=np.int64, count=len(value))
+        data[positions] = np.array(list(value.values()), dtype=np.float64)
+        return data
+
+    if len(value) != count:
+        raise ValueError(f'{len(value)} values for {count} cells')
+    # None becomes NaN here
+    return np.array(value, dtype=np.float64)
+
+
+def decode(obj: dict[str, Any]) -> Cube:
+    """The first dataset of a parsed JSON-stat document."""
+    if obj.get('class') != 'dataset':
+        # 1.0 bundle of named datasets
+        obj = next(iter(obj.values()))
+
+    dims = obj['dimension']
+    ids = obj.get('id', dims.get('id'))
+    sizes = obj.get('size', dims.get('size'))
+    if ids is None or sizes is None or len(ids) != len(sizes):
+        raise ValueError('dataset has no matching `id` and `size`')
+
+    dimensions = [_dimension(dim_id, dims[dim_id], size) for dim_id, size in zip(ids, sizes)]
+    values = _values(obj['value'], int(np.prod(sizes, dtype=np.int64)))
+    data = np.ma.masked_invalid(values.reshape(sizes), copy=False)
+
+    return Cube(data, dimensions, obj.get('label', ''))
+
+
+def read(pathname: str) -> Cube:
+    with open(pathname, 'r', encoding='utf-8') as fp:
+        return decode(json.load(fp))
@@ -1,52 +1,270 @@
 #!/usr/bin/env python
 
-import json
-from typing import NamedTuple
-import matplotlib.pyplot as plt
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+from collections.abc import Callable, Iterable, Iterator
+from typing import Any
+
 import numpy as np
-from collections import deque
+import numpy.typing as npt
+
+import jsonstat
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from common.plotting import pyplot  # noqa: E402
 
 DATAF_F_NAME = './data.json'
 
+# Frames drawn per year, the ones between years are interpolated
+FRAMES_PER_YEAR = 10
+FPS = 20
+# Video formats by file extension
+WRITERS = ('.gif', '.mp4')
 
-# 'Papiravis', 'Fjernsyn', 'Radio', 'Bøker', 'Internett', 'Digitale spill'
-class Data(NamedTuple):
-    year: int
-    data: dict[str, int]
 
+def load_usage(pathname: str) -> tuple[tuple[str, ...], npt.NDArray[np.int64], npt.NDArray[np.float64]]:
+    """Media names, years, and minutes per day as (years, media), NaN where
+    a medium was not counted that year."""
+    usage = jsonstat.read(pathname).squeeze()
+    categories = usage.dimension('Media').labels
+    years = np.array(usage.dimension('Tid').codes, dtype=np.int64)
+    minutes = usage.data.transpose(usage.axis('Tid'), usage.axis('Media')).filled(np.nan)
+    return categories, years, minutes
 
-def main() -> None:
-    with open(DATAF_F_NAME, 'r', encoding='utf-8') as fp:
-        raw_data = json.load(fp)
 
-    categories = tuple(raw_data['dataset']['dimension']['Media']['category']['label'].values())
-    years = tuple(map(int, raw_data['dataset']['dimension']['Tid']['category']['index']))
-    values = np.array_split(np.array(raw_data['dataset']['value']), len(categories))
+def interpolate(years: npt.NDArray[np.int64], minutes: npt.NDArray[np.float64],
+                steps: int) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.float64]]:
+    """Year label and bar heights of every frame, `steps` per year.
+
+    Heights move linearly between years. A medium missing on one side
+    holds the nearest counted value instead, and stays NaN between two
+    missing years.
+    """
+    frames = (len(years) - 1) * steps + 1
+    pos = np.arange(frames) / steps
+    i = np.minimum(pos.astype(np.int64), len(years) - 1)
+    j = np.minimum(i + 1, len(years) - 1)
+    frac = (pos - i)[:, None]
 
-    data: deque[Data] = deque()
-    cats = {}
-    for i in range(len(years)):
-        for j, category in enumerate(categories):
-            if values[j][i] is None:
-                cats[category] = 0
-            else:
-                cats[category] = values[j][i]
+    a, b = minutes[i], minutes[j]
+    heights = (1 - frac) * a + frac * b
+    heights = np.where(np.isnan(a), b, heights)
+    heights = np.where(np.isnan(b), a, heights)
+    # Label with the nearest surveyed year, there was no survey in 1993
+    label = np.where(frac[:, 0] < 0.5, years[i], years[j])
 
-        data.append(Data(year=years[i], data=cats))
-        cats = {}
+    return label, heights
 
+
+def make_figure(plt: Any, categories: tuple[str, ...]) -> tuple[Any, Any, Any, Any]:
+    """Figure with the bars and the year label, made once and then only
+    updated in place."""
     fig, ax = plt.subplots()
+    ax.grid(axis='y')
+    ax.set_axisbelow(True)
+    bars = ax.bar(categories, np.zeros(len(categories)))
+    ax.set_ylabel('Bruk in minutter')
+    ax.set_ylim((0, 250))
+    # Inside the axes, so blitting redraws it with the bars
+    label = ax.text(0.98, 0.95, '', transform=ax.transAxes, ha='right', va='top',
+                    fontsize='x-large', animated=True)
+    # The bars stand on the bottom spine, which is drawn above them
+    for artist in (*bars, ax.spines['bottom']):
+        artist.set_animated(True)
+    return fig, ax, bars, label
+
+
+def frame_updater(ax: Any, bars: Any, label: Any, labels: npt.NDArray[np.int64],
+                  heights: npt.NDArray[np.float64]) -> Callable[[int], list[Any]]:
+    """Sets a frame's bars and year, and returns what has to be redrawn."""
+    spine = ax.spines['bottom']
+
+    def update(frame: int) -> list[Any]:
+        for bar, height in zip(bars, heights[frame]):
+            bar.set_height(height)
+        label.set_text(f'År: {labels[frame]}')
+        return [*bars, spine, label]
+
+    return update
+
+
+def chart(plt: Any, year: int | None = None) -> Any:
+    """The bars of one surveyed year, the last one by default."""
+    categories, years, minutes = load_usage(DATAF_F_NAME)
+    if year is None:
+        frame = len(years) - 1
+    elif year in years:
+        frame = int(np.flatnonzero(years == year)[0])
+    else:
+        raise ValueError(f'no survey in {year}, have {years[0]} to {years[-1]}')
+
+    fig, ax, bars, label = make_figure(plt, categories)
+    for artist in frame_updater(ax, bars, label, years, minutes)(frame):
+        artist.set_animated(False)
+    return fig
+
+
+def animate(plt: Any, categories: tuple[str, ...], years: npt.NDArray[np.int64],
+            minutes: npt.NDArray[np.float64], steps: int, fps: int) -> Any:
+    from matplotlib.animation import FuncAnimation
+
+    labels, heights = interpolate(years, minutes, steps)
+    fig, ax, bars, label = make_figure(plt, categories)
+    return FuncAnimation(fig, frame_updater(ax, bars, label, labels, heights), frames=len(heights),
+                         interval=1000 / fps, blit=True, repeat=False)
+
+
+def render_frames(plt: Any, categories: tuple[str, ...], years: npt.NDArray[np.int64],
+                  minutes: npt.NDArray[np.float64],
+                  steps: int) -> Iterator[npt.NDArray[np.uint8]]:
+    """Every frame as an RGBA image, blitted on the Agg canvas.
+
+    Everything but the bars and the year label is drawn once. Each frame
+    then only restores that background and draws those on top, the same
+    as in a window. The array is the canvas buffer, reused for the next
+    frame.
+    """
+    labels, heights = interpolate(years, minutes, steps)
+    fig, ax, bars, label = make_figure(plt, categories)
+    update = frame_updater(ax, bars, label, labels, heights)
+    fig.canvas.draw()
+    background = fig.canvas.copy_from_bbox(fig.bbox)
+    try:
+        for frame in range(len(heights)):
+            fig.canvas.restore_region(background)
+            for artist in update(frame):
+                ax.draw_artist(artist)
+            yield np.asarray(fig.canvas.buffer_rgba())
+    finally:
+        plt.close(fig)
+
+
+def _pack(frame: npt.NDArray[np.uint8]) -> npt.NDArray[np.uint32]:
+    """RGBA pixels as 0xBBGGRR."""
+    return np.ascontiguousarray(frame).view('<u4')[..., 0] & np.uint32(0xffffff)
+
+
+def _unpack(packed: npt.NDArray[np.uint32]) -> npt.NDArray[np.int64]:
+    packed = packed.astype(np.int64)
+    return np.stack([packed & 0xff, (packed >> 8) & 0xff, packed >> 16], axis=1)
+
+
+def save_gif(frames: Iterable[npt.NDArray[np.uint8]], pathname: str, fps: int) -> None:
+    """One palette for the whole film, the 256 commonest colours of the first
+    frame. Colours in it are kept exactly, any others take the nearest one.
+    (PIL's `quantize(palette=...)` shifts even exact matches, white to 252.)
+    """
+    from PIL import Image
+
+    lut = np.full(1 << 24, -1, dtype=np.int16)
+    palette = None
+    images = []
+    for frame in frames:
+        packed = _pack(frame)
+        if palette is None:
+            colours, counts = np.unique(packed, return_counts=True)
+            palette = colours[np.argsort(counts)[::-1][:256]]
+            lut[palette] = np.arange(len(palette))
+            rgb = _unpack(palette)
+
+        index = lut[packed]
+        missing = index < 0
+        if missing.any():
+            new = np.unique(packed[missing])
+            dist = ((_unpack(new)[:, None, :] - rgb[None, :, :]) ** 2).sum(axis=2)
+            lut[new] = dist.argmin(axis=1)
+            index = lut[packed]
+
+        image = Image.fromarray(index.astype(np.uint8), mode='P')
+        image.putpalette(rgb.astype(np.uint8).tobytes())
+        images.append(image)
+
+    if not images:
+        raise OSError('no frames to write')
+    images[0].save(pathname, save_all=True, append_images=images[1:],
+                   duration=round(1000 / fps), loop=0, optimize=False)
+
+    return None
+
+
+def save_mp4(frames: Iterable[npt.NDArray[np.uint8]], pathname: str, fps: int) -> None:
+    """Pipe raw frames to ffmpeg."""
+    proc = None
+    try:
+        for frame in frames:
+            if proc is None:
+                height, width = frame.shape[:2]
+                proc = subprocess.Popen(
+                    ['ffmpeg', '-loglevel', 'error', '-y', '-f', 'rawvideo', '-pix_fmt', 'rgba',
+                     '-s', f'{width}x{height}', '-r', str(fps), '-i', '-',
+                     '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p', pathname],
+                    stdin=subprocess.PIPE)
+            assert proc.stdin is not None
+            proc.stdin.write(frame.tobytes())
+    finally:
+        if proc is not None:
+            assert proc.stdin is not None
+            proc.stdin.close()
+            if proc.wait() != 0:
+                raise OSError(f'ffmpeg failed with status {proc.returncode}')
+
+    return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Media usage in Norway, year by year')
+    parser.add_argument('-o', '--output',
+                        type=str,
+                        required=False,
+                        help=f'render to a video file ({", ".join(WRITERS)}) instead of a window')
+    parser.add_argument('-s', '--steps',
+                        type=int,
+                        default=FRAMES_PER_YEAR,
+                        required=False,
+                        help=f'frames per year, 1 for no interpolation (default {FRAMES_PER_YEAR})')
+    parser.add_argument('--fps',
+                        type=int,
+                        default=FPS,
+                        required=False,
+                        help=f'frames per second (default {FPS})')
+    args = parser.parse_args()
+
+    if args.steps < 1 or args.fps < 1:
+        print("ERROR: --steps and --fps have to be at least 1", file=sys.stderr)
+        exit(1)
+
+    extension = None
+    if args.output:
+        extension = os.path.splitext(args.output)[1].lower()
+        if extension not in WRITERS:
+            print(f"ERROR: can only write {', '.join(WRITERS)} files", file=sys.stderr)
+            exit(1)
+        if extension == '.mp4' and shutil.which('ffmpeg') is None:
+            print(f"ERROR: `ffmpeg` is needed to write {args.output}", file=sys.stderr)
+            exit(1)
+
+    plt = pyplot(args.output)
+    categories, years, minutes = load_usage(DATAF_F_NAME)
+
+    if extension is None:
+        anim = animate(plt, categories, years, minutes, args.steps, args.fps)  # noqa: F841
+        plt.show()
+        return None
 
-    for i, val in enumerate(data):
-        ax.clear()
-        ax.grid(axis='y')
-        ax.bar(categories, val.data.values())
-        ax.set_ylabel('Bruk in minutter')
-        ax.set_ylim((0, 250))
-        ax.set_title(f'År: {val.year}')
-        plt.pause(0.5)
+    frames = render_frames(plt, categories, years, minutes, args.steps)
+    try:
+        if extension == '.gif':
+            save_gif(frames, args.output, args.fps)
+        else:
+            save_mp4(frames, args.output, args.fps)
+    except OSError as err:
+        print(f"ERROR: could not write {args.output}: {err}", file=sys.stderr)
+        exit(1)
 
-    plt.show()
+    return None
 
 
 if __name__ == '__main__':
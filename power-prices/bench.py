@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""Time the hourly analytics on a synthetic store, a decade of 5 zones by
+default. Each step is the fastest of a few runs, on a freshly mapped store.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+
+import numpy as np
+
+import main as pp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from common.timing import add_repeat_argument, best_of  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark power-prices analytics')
+    parser.add_argument('-y', '--years',
+                        type=int,
+                        default=10,
+                        help='years of hourly data')
+    parser.add_argument('-z', '--zones',
+                        type=int,
+                        default=5,
+                        help='price zones')
+    add_repeat_argument(parser, 5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pp.save_store(tmp, pp.generate_store(args.years, args.zones))
+        store = pp.load_store(tmp)
+        window = pp.ROLLING_DAYS * 24
+
+        steps = {
+            'load_store': lambda: pp.load_store(tmp),
+            'regress': lambda: pp.regress(store.temperature, store.price),
+            'rolling_correlation': lambda: pp.rolling_correlation(
+                store.temperature, store.price, window),
+            'resample_day': lambda: pp.resample(store.time, store.price, 'day'),
+            'resample_week': lambda: pp.resample(store.time, store.price, 'week'),
+            'all': lambda: (pp.analyse(pp.load_store(tmp), window),
+                            pp.resample(store.time, store.price, 'day'),
+                            pp.resample(store.time, store.price, 'week')),
+        }
+        report = {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'hours': len(store.time),
+            'zones': len(store.zones),
+            'seconds': {name: best_of(args.repeat, step)[0] for name, step in steps.items()},
+        }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,37 +1,368 @@
 #!/usr/bin/env python
 
+import argparse
+import json
+import os
+import sys
+from typing import Any, NamedTuple
+
 import numpy as np
 import numpy.typing as npt
-import matplotlib.pyplot as plt
 
-TEMPERATURE_F_NAME = "temp.txt"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from common.textdata import load_table  # noqa: E402
+
+# Daily weather for the month, as copied from yr: day, min, max and mean
+# temperature, normal, precipitation, snow depth, mean and max wind
+TEMPERATURE_F_NAME = "data.txt"
+TEMPERATURE_DTYPE = [('day', 'f4'), ('min', 'f4'), ('max', 'f4'), ('mean', 'f4')]
 POWER_PRICE_F_NAME = "power_prices.txt"
-DAYS_BUF_SIZE = 31
 
+# An hourly store is a directory of .npy files, memory mapped when read:
+# time (hours,) datetime64[h], price and temperature (hours, zones) float32
+# in øre/kWh and °C, and zones (zones,) names
+STORE_FILES = ('time', 'price', 'temperature', 'zones')
+ZONES = ('NO1', 'NO2', 'NO3', 'NO4', 'NO5')
+# An import file is a text table with a header line naming the zones,
+# `time NO1 NO2 ...`, then a line per hour: the hour, like 2013-01-01T00,
+# and price and temperature of each zone in turn
+IMPORT_TIME = 'time'
+ROLLING_DAYS = 30
+RESAMPLE_UNITS = ('day', 'week')
+
+
+class Store(NamedTuple):
+    time: npt.NDArray[np.datetime64]
+    price: npt.NDArray[np.float32]
+    temperature: npt.NDArray[np.float32]
+    zones: npt.NDArray[np.str_]
+
+
+class Regression(NamedTuple):
+    slope: npt.NDArray[np.float64]      # øre/kWh per °C
+    intercept: npt.NDArray[np.float64]  # øre/kWh at 0 °C
+    r2: npt.NDArray[np.float64]
+    n: npt.NDArray[np.int64]
+
+
+def read_temperatures(pathname: str) -> npt.NDArray[np.float32]:
+    return np.asarray(load_table(pathname, TEMPERATURE_DTYPE, usecols=(0, 1, 2, 3))['mean'],
+                      dtype=np.float32)
+
+
+def read_prices(pathname: str) -> npt.NDArray[np.float32]:
+    return np.asarray(load_table(pathname, np.float32), dtype=np.float32)
+
+
+def save_store(path: str, store: Store) -> None:
+    os.makedirs(path, exist_ok=True)
+    for name, array in zip(STORE_FILES, store):
+        np.save(os.path.join(path, f'{name}.npy'), np.asarray(array))
+
+    return None
+
+
+def load_store(path: str) -> Store:
+    """Memory map a store. Single zone stores may have 1-d price and
+    temperature arrays, they come back as one column.
+    """
+    arrays = [np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in STORE_FILES[:3]]
+    time, price, temperature = arrays
+    if price.ndim == 1:
+        price, temperature = price[:, None], temperature[:, None]
+    try:
+        zones = np.load(os.path.join(path, 'zones.npy'))
+    except FileNotFoundError:
+        zones = np.array([f'zone{i}' for i in range(price.shape[1])])
+
+    if not (len(time) == len(price) == len(temperature)) or price.shape != temperature.shape:
+        raise ValueError(f'`{path}`: time, price and temperature do not line up')
 
-def read_file_data(pathname: str, size: int) -> npt.NDArray[np.float32]:
-    buffer = np.zeros(DAYS_BUF_SIZE, dtype=np.float32)
+    return Store(time, price, temperature, zones)
+
+
+def import_store(pathname: str) -> Store:
+    """Store of an hourly import file. Hours left out of it are NaN, and so
+    are fields that are no number.
+    """
     with open(pathname, 'r', encoding='utf-8') as fp:
-        for i in range(size):
-            buffer[i] = np.float32(fp.readline())
+        header = fp.readline().split()
+        first = fp.readline().strip()
+    if len(header) < 2 or header[0] != IMPORT_TIME:
+        raise ValueError(f'`{pathname}`: the first line has to be `{IMPORT_TIME}` and the zones')
+    if not first:
+        raise ValueError(f'`{pathname}`: no hours')
+    zones = np.array(header[1:])
 
-    return buffer
+    try:
+        time = load_table(pathname, 'datetime64[h]', usecols=(0,), skiprows=1)
+    except ValueError:
+        raise ValueError(f'`{pathname}`: the hours have to be written like 2013-01-01T00')
+    values = load_table(pathname, np.float32, usecols=tuple(range(1, 1 + 2 * len(zones))),
+                        skiprows=1)
+    if np.isnat(time).any() or np.any(np.diff(time) <= np.timedelta64(0, 'h')):
+        raise ValueError(f'`{pathname}`: the hours have to be increasing')
+    values = values.reshape(len(time), len(zones), 2)
 
+    hours = (time - time[0]).astype(np.int64)
+    price = np.full((hours[-1] + 1, len(zones)), np.nan, dtype=np.float32)
+    temperature = np.full_like(price, np.nan)
+    price[hours] = values[:, :, 0]
+    temperature[hours] = values[:, :, 1]
 
-def main() -> None:
-    time = np.arange(DAYS_BUF_SIZE)
-    temperatures = read_file_data(TEMPERATURE_F_NAME, DAYS_BUF_SIZE)
-    prices = read_file_data(POWER_PRICE_F_NAME, DAYS_BUF_SIZE) / 100
+    return Store(time[0] + np.arange(len(price)).astype('timedelta64[h]'),
+                 price, temperature, zones)
+
+
+def generate_store(years: int, zones: int, seed: int = 0) -> Store:
+    """Synthetic hourly prices that go up when it gets cold."""
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('2013-01-01T00', 'h')
+    time = start + np.arange(int(years * 365.25 * 24), dtype=np.int64).astype('timedelta64[h]')
+    hours = np.arange(len(time))[:, None]
+
+    season = -np.cos(2 * np.pi * hours / (365.25 * 24))
+    daily = -np.cos(2 * np.pi * (hours - 3) / 24)
+    north = np.linspace(0, 8, zones)[None, :]
+    temperature = 6 - north + 10 * season + 3 * daily + rng.normal(0, 3, (len(time), zones))
+    # Prices follow demand, and the evening peak, plus noise
+    price = (80 - 4 * temperature + 15 * np.maximum(daily, 0)
+             + rng.normal(0, 20, (len(time), zones)))
+
+    return Store(time, price.astype(np.float32), temperature.astype(np.float32),
+                 np.array(ZONES[:zones] if zones <= len(ZONES) else
+                          [f'NO{i + 1}' for i in range(zones)]))
+
+
+def valid_pairs(x: npt.ArrayLike, y: npt.ArrayLike) -> tuple[npt.NDArray[np.float64],
+                                                            npt.NDArray[np.float64],
+                                                            npt.NDArray[np.bool_]]:
+    """x and y as float64 with 0 where either is NaN, and where both are valid."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    valid = ~(np.isnan(x) | np.isnan(y))
+    return np.where(valid, x, 0.0), np.where(valid, y, 0.0), valid
+
+
+def regress(temperature: npt.ArrayLike, price: npt.ArrayLike) -> Regression:
+    """Least squares price = intercept + slope * temperature, per zone."""
+    x, y, valid = valid_pairs(temperature, price)
+    n = valid.sum(axis=0)
+    with np.errstate(all='ignore'):
+        mx = x.sum(axis=0) / n
+        my = y.sum(axis=0) / n
+        dx = np.where(valid, x - mx, 0.0)
+        dy = np.where(valid, y - my, 0.0)
+        sxx = (dx * dx).sum(axis=0)
+        syy = (dy * dy).sum(axis=0)
+        sxy = (dx * dy).sum(axis=0)
+        slope = sxy / sxx
+        r2 = sxy * sxy / (sxx * syy)
+
+    return Regression(slope, my - slope * mx, r2, n)
+
+
+def rolling_correlation(x: npt.ArrayLike, y: npt.ArrayLike, window: int) -> npt.NDArray[np.float64]:
+    """Pearson r of every `window` consecutive rows, per column.
+
+    Row i covers rows i to i + window - 1, so there are len - window + 1
+    rows. Windows use only rows where both are valid; fewer than 2 is NaN.
+    """
+    x, y, valid = valid_pairs(x, y)
+    if x.ndim == 1:
+        x, y, valid = x[:, None], y[:, None], valid[:, None]
+    # Centred first, so the sums of squares do not cancel out
+    with np.errstate(all='ignore'):
+        x = np.where(valid, x - x.sum(axis=0) / valid.sum(axis=0), 0.0)
+        y = np.where(valid, y - y.sum(axis=0) / valid.sum(axis=0), 0.0)
+
+    def windows(a: npt.NDArray[np.generic]) -> npt.NDArray[np.float64]:
+        c = np.zeros((len(a) + 1,) + a.shape[1:], dtype=np.float64)
+        np.cumsum(a, axis=0, out=c[1:])
+        return c[window:] - c[:-window]
+
+    n = windows(valid)
+    sx, sy = windows(x), windows(y)
+    sxx, syy, sxy = windows(x * x), windows(y * y), windows(x * y)
+    with np.errstate(all='ignore'):
+        cov = n * sxy - sx * sy
+        r = cov / np.sqrt((n * sxx - sx * sx) * (n * syy - sy * sy))
+    r[n < 2] = np.nan
+
+    return np.clip(r, -1.0, 1.0)
+
+
+def period_starts(time: npt.NDArray[np.datetime64], unit: str) -> npt.NDArray[np.intp]:
+    """Index of the first hour of each day, or week starting on Monday."""
+    days = time.astype('datetime64[D]').astype(np.int64)
+    # 1970-01-01 was a Thursday
+    key = days if unit == 'day' else (days + 3) // 7
+    return np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+
+
+def resample(time: npt.NDArray[np.datetime64], values: npt.ArrayLike,
+             unit: str) -> tuple[npt.NDArray[np.datetime64], npt.NDArray[np.float64]]:
+    """Mean of the valid values per day or week, and each period's start."""
+    starts = period_starts(time, unit)
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    sums = np.add.reduceat(np.where(valid, values, 0.0), starts, axis=0)
+    counts = np.add.reduceat(valid.astype(np.int64), starts, axis=0)
+    with np.errstate(all='ignore'):
+        return time[starts], sums / counts
+
+
+def analyse(store: Store, window: int) -> dict[str, dict[str, float]]:
+    """Regression of price on temperature and rolling correlation, per zone."""
+    fit = regress(store.temperature, store.price)
+    r = rolling_correlation(store.temperature, store.price, window)
+    with np.errstate(all='ignore'):
+        r_mean = np.nanmean(r, axis=0) if len(r) else np.full(len(store.zones), np.nan)
+
+    results = {}
+    for j, zone in enumerate(store.zones.tolist()):
+        results[zone] = {
+            'hours': int(fit.n[j]),
+            'slope': float(fit.slope[j]),
+            'intercept': float(fit.intercept[j]),
+            'r2': float(fit.r2[j]),
+            'rolling_r_mean': float(r_mean[j]),
+            'rolling_r_min': float(np.nanmin(r[:, j])) if np.any(~np.isnan(r[:, j])) else np.nan,
+            'rolling_r_max': float(np.nanmax(r[:, j])) if np.any(~np.isnan(r[:, j])) else np.nan,
+        }
+
+    return results
+
+
+def print_analysis(results: dict[str, dict[str, float]], window_days: int) -> None:
+    print(f"{'zone':<6} {'hours':>7} {'øre/°C':>8} {'at 0°C':>8} {'r²':>6} "
+          f"{f'r {window_days}d':>8} {'min':>6} {'max':>6}")
+    for zone, res in results.items():
+        print(f"{zone:<6} {res['hours']:>7} {res['slope']:>8.2f} {res['intercept']:>8.1f} "
+              f"{res['r2']:>6.3f} {res['rolling_r_mean']:>8.3f} "
+              f"{res['rolling_r_min']:>6.3f} {res['rolling_r_max']:>6.3f}")
+
+    return None
+
+
+def print_resampled(store: Store, unit: str) -> None:
+    starts, prices = resample(store.time, store.price, unit)
+    _, temps = resample(store.time, store.temperature, unit)
+    zones = store.zones.tolist()
+    print(f"{unit:<10} " + ' '.join(f'{z + " øre":>9} {z + " °C":>7}' for z in zones))
+    for t, p, c in zip(starts.astype('datetime64[D]').astype(str), prices, temps):
+        print(f"{t:<10} " + ' '.join(f'{pz:>9.1f} {cz:>7.1f}' for pz, cz in zip(p, c)))
+
+    return None
+
+
+def chart(plt: Any) -> Any:
+    """December's daily temperature and price side by side."""
+    temperatures = read_temperatures(TEMPERATURE_F_NAME)
+    prices = read_prices(POWER_PRICE_F_NAME) / 100
 
     fig, ax = plt.subplots()
 
-    ax.barh(time + 0.2, temperatures, height=0.4)
-    ax.barh(time - 0.2, prices, height=0.4)
+    ax.barh(np.arange(len(temperatures)) + 0.2, temperatures, height=0.4)
+    ax.barh(np.arange(len(prices)) - 0.2, prices, height=0.4)
     ax.set_title('Strømpriser samenlignet med temperatur for desember 2022')
     ax.set_ylabel('Dager')
 
+    return fig
+
+
+def plot_month() -> None:
+    import matplotlib.pyplot as plt
+    chart(plt)
     plt.show()
 
+    return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Power prices against temperature')
+    parser.add_argument('-a', '--analyse',
+                        metavar='STORE',
+                        type=str,
+                        required=False,
+                        help='analyse an hourly store instead of plotting the month')
+    parser.add_argument('-g', '--generate',
+                        metavar='STORE',
+                        type=str,
+                        required=False,
+                        help='write a synthetic hourly store')
+    parser.add_argument('-i', '--import',
+                        dest='import_',
+                        nargs=2,
+                        metavar=('FILE', 'STORE'),
+                        required=False,
+                        help=f'write an hourly store of a text table, `{IMPORT_TIME}` and the '
+                             'zones on the first line, then the hour and each zone\'s price '
+                             'and temperature per line')
+    parser.add_argument('-y', '--years',
+                        type=int,
+                        default=10,
+                        required=False,
+                        help='years of synthetic data (default 10)')
+    parser.add_argument('-z', '--zones',
+                        type=int,
+                        default=len(ZONES),
+                        required=False,
+                        help=f'price zones of synthetic data (default {len(ZONES)})')
+    parser.add_argument('-w', '--window',
+                        metavar='DAYS',
+                        type=int,
+                        default=ROLLING_DAYS,
+                        required=False,
+                        help=f'rolling correlation window (default {ROLLING_DAYS})')
+    parser.add_argument('-r', '--resample',
+                        choices=RESAMPLE_UNITS,
+                        required=False,
+                        help='also print mean price and temperature per day or week')
+    parser.add_argument('--json',
+                        action='store_true',
+                        help='print the analysis as JSON')
+    args = parser.parse_args()
+
+    if args.import_:
+        pathname, path = args.import_
+        try:
+            save_store(path, import_store(pathname))
+        except (OSError, ValueError) as err:
+            print(f"ERROR: could not import: {err}", file=sys.stderr)
+            exit(1)
+        return None
+
+    if args.generate:
+        if args.years < 1 or args.zones < 1:
+            print("ERROR: --years and --zones have to be at least 1", file=sys.stderr)
+            exit(1)
+        save_store(args.generate, generate_store(args.years, args.zones))
+        return None
+
+    if not args.analyse:
+        plot_month()
+        return None
+
+    try:
+        store = load_store(args.analyse)
+    except (OSError, ValueError) as err:
+        print(f"ERROR: could not load store: {err}", file=sys.stderr)
+        exit(1)
+    if args.window < 1:
+        print("ERROR: --window has to be at least 1 day", file=sys.stderr)
+        exit(1)
+
+    results = analyse(store, args.window * 24)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_analysis(results, args.window)
+    if args.resample:
+        print_resampled(store, args.resample)
+
+    return None
+
 
 if __name__ == '__main__':
     main()
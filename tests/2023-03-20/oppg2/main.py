@@ -15,7 +15,7 @@ def parse_remember_file(filename: str) -> list[Any]:
         return json.load(fp)
 
 
-def main() -> None:
+def chart(plt: Any) -> Any:
     data_obj = parse_remember_file(FILENAME)
 
     # Slow: O(4n), but there is not much data, so it doesn't matter
@@ -38,6 +38,11 @@ def main() -> None:
     ax.legend(loc="upper left")
     ax.set_ylim((0, 3_000_000))
 
+    return fig
+
+
+def main() -> None:
+    chart(plt)
     plt.show()
 
     return None
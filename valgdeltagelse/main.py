@@ -1,31 +1,36 @@
 #!/usr/bin/env python
 
+import os
+import sys
+from typing import Any
+
 import numpy as np
 import matplotlib.pyplot as plt
 
-VALG_DATA_F = "./valgdeltagelse.txt"
-DATAPOINTS = 20
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from common.textdata import load_table  # noqa: E402
 
+VALG_DATA_F = "./valgdeltagelse.txt"
+VALG_DTYPE = [('year', 'i4'), ('vote', 'f4')]
 
-def main() -> None:
-    time = np.zeros(DATAPOINTS, dtype=np.int32)
-    vote = np.zeros(DATAPOINTS, dtype=np.float32)
 
-    with open(VALG_DATA_F, 'r', encoding='utf-8') as fp:
-        for i in range(DATAPOINTS):
-            line = fp.readline().strip().replace(',', '.')
-            time[i] = np.float32(line.split(';')[0])
-            vote[i] = np.float32(line.split(';')[1])
+def chart(plt: Any) -> Any:
+    data = load_table(VALG_DATA_F, VALG_DTYPE, delimiter=';')
 
     fig, ax = plt.subplots()
 
-    ax.bar(time, vote, width=2.5, color='#55cdfc', label='wowie')
+    ax.bar(data['year'], data['vote'], width=2.5, color='#55cdfc', label='wowie')
     ax.grid(axis='y')
     ax.set_title('Valgoppsluttning fra 1945 til 2021')
     ax.set_xlabel('Tid i år')
     ax.set_ylabel('Valgdeltagelse i prosent')
     ax.set_ylim((50, 100))
 
+    return fig
+
+
+def main() -> None:
+    chart(plt)
     plt.show()
 
 
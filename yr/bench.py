@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""Benchmark forecast extraction on a full locationforecast response.
+
+By default the response is synthetic but shaped like met.no's compact
+answer: hourly steps for about two and a half days, then six-hourly up to
+ten days. A captured response can be given with --response instead.
+"""
+
+import argparse
+import datetime as dt
+import json
+import math
+import platform
+import os
+import random
+import sys
+from typing import Any
+
+import numpy as np
+
+import main as yr
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from common.timing import add_repeat_argument, best_of  # noqa: E402
+
+START = dt.datetime(2023, 3, 20, 12)
+
+
+def synthetic_response(hourly: int = 60, six_hourly: int = 30, seed: int = 0) -> Any:
+    """A compact forecast with every variable filled in, like met.no sends."""
+    rnd = random.Random(seed)
+    offsets = list(range(hourly)) + [hourly + 6 * i for i in range(six_hourly)]
+    series = []
+    for h in offsets:
+        daily = math.sin((h - 9) / 24 * 2 * math.pi)
+        series.append({
+            'time': (START + dt.timedelta(hours=h)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'data': {
+                'instant': {
+                    'details': {
+                        'air_pressure_at_sea_level': round(rnd.gauss(1010, 8), 1),
+                        'air_temperature': round(4 + 5 * daily + rnd.gauss(0, 1), 1),
+                        'cloud_area_fraction': round(rnd.uniform(0, 100), 1),
+                        'relative_humidity': round(rnd.uniform(40, 100), 1),
+                        'wind_from_direction': round(rnd.uniform(0, 360), 1),
+                        'wind_speed': round(rnd.expovariate(0.3), 1),
+                    },
+                },
+                'next_1_hours': {
+                    'summary': {'symbol_code': 'cloudy'},
+                    'details': {'precipitation_amount': 0.0},
+                },
+            },
+        })
+
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [10.7862, 59.9079, 10]},
+        'properties': {
+            'meta': {'updated_at': START.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                     'units': {var: '' for var in yr.FORECAST_VARS}},
+            'timeseries': series,
+        },
+    }
+
+
+def extract_records(json_obj: Any, variables: tuple[str, ...],
+                    hours: int | None = None) -> tuple[Any, Any]:
+    """The straightforward way: a dict per step, then arrays from those."""
+    records = []
+    for step in json_obj['properties']['timeseries']:
+        record = {'time': dt.datetime.strptime(step['time'], '%Y-%m-%dT%H:%M:%SZ')}
+        record.update(step['data']['instant']['details'])
+        records.append(record)
+    if hours is not None and records:
+        end = records[0]['time'] + dt.timedelta(hours=hours)
+        records = [r for r in records if r['time'] < end]
+
+    times = np.array([r['time'] for r in records], dtype='datetime64[s]')
+    values = np.array([[r.get(var, np.nan) for var in variables] for r in records],
+                      dtype=np.float64).reshape(len(records), len(variables))
+    return times, values
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark yr forecast extraction')
+    parser.add_argument('-r', '--response',
+                        type=str,
+                        help='captured locationforecast JSON to use instead of a synthetic one')
+    parser.add_argument('-H', '--hours',
+                        type=int,
+                        help='horizon to extract, as `main.py --hours`')
+    add_repeat_argument(parser, 200)
+    args = parser.parse_args()
+
+    if args.response:
+        with open(args.response, 'r', encoding='utf-8') as fp:
+            text = fp.read()
+    else:
+        text = json.dumps(synthetic_response())
+    json_obj = json.loads(text)
+    variables = yr.FORECAST_VARS
+
+    times, values = yr.extract_timeseries(json_obj, variables, args.hours)
+    ref_times, ref_values = extract_records(json_obj, variables, args.hours)
+    assert np.array_equal(times, ref_times) and np.array_equal(values, ref_values, equal_nan=True), \
+        'extract_timeseries disagrees with the per-step records'
+
+    # In microseconds, a response takes well under a millisecond
+    decode_us = best_of(args.repeat, lambda: json.loads(text))[0] * 1e6
+    records_us = best_of(args.repeat, lambda: extract_records(json_obj, variables, args.hours))[0] * 1e6
+    vectorized_us = best_of(args.repeat,
+                            lambda: yr.extract_timeseries(json_obj, variables, args.hours))[0] * 1e6
+    summarise_us = best_of(args.repeat, lambda: yr.summarise('bench', times, values, variables))[0] * 1e6
+
+    report = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'response': args.response or 'synthetic',
+        'bytes': len(text),
+        'steps': len(json_obj['properties']['timeseries']),
+        'extracted_steps': len(times),
+        'variables': len(variables),
+        'decode_us': decode_us,
+        'records_us': records_us,
+        'vectorized_us': vectorized_us,
+        'summarise_us': summarise_us,
+    }
+    print(json.dumps(report, indent=2))
+    print(f"{records_us / vectorized_us:.1f}x faster than per-step records",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
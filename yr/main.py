@@ -1,11 +1,25 @@
 #!/usr/bin/env python
 
-import requests as req
-import numpy as np
-import numpy.typing as npt
+# numpy and requests are imported by the functions that use them, so each
+# subcommand only pays for its own imports. See test.sh.
+from __future__ import annotations
+
 import json
 import argparse
+import math
+import os
 import sys
+import zlib
+from typing import TYPE_CHECKING, Any, TypedDict
+
+if TYPE_CHECKING:
+    import numpy as np
+    import numpy.typing as npt
+    import requests as req
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from common.httpcache import HttpCache, get_json, make_session  # noqa: E402
+from common.plotting import pyplot  # noqa: E402
 
 HEADERS = {
     'Content-type': 'application/json',
@@ -16,10 +30,519 @@ HEADERS = {
 DEFAULT_LAT = 59.9079
 DEFAULT_LON = 10.7862
 
+MET_URL = 'https://api.met.no/weatherapi/locationforecast/2.0/compact?lat={}&lon={}'
+# met.no wants at most 4 decimals, so places closer than that share a forecast
+COORD_DECIMALS = 4
+# Upper bound on concurrent met.no requests
+FETCH_WORKERS = 8
+
+# Instant variables of the compact forecast
+FORECAST_VARS = (
+    'air_pressure_at_sea_level',
+    'air_temperature',
+    'cloud_area_fraction',
+    'relative_humidity',
+    'wind_from_direction',
+    'wind_speed',
+)
+
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'yr')
+
+PLACE_DATA_F = './place_data.txt'
+# Compiled from PLACE_DATA_F: cities sorted by lower case name, and an open
+# addressing hash table of indices into them keyed on the exact name
+PLACE_INDEX_F = './place_data.npy'
+PLACE_HASH_F = './place_data.hash.npy'
+PLACE_FIELDS = [('place', 'U32'), ('key', 'U32'), ('lat', 'f4'), ('long', 'f4')]
+
+# Side of a CityGrid cell in degrees, and of the square of cells that
+# share a candidate list
+GRID_CELL = 0.5
+GRID_BUCKET = 4
+EARTH_RADIUS = 6371.0  # km
+
 
 def parse_city_data() -> npt.NDArray[np.generic]:
+    import numpy as np
     dt = np.dtype([('place', 'U32'), ('lat', 'f4'), ('long', 'f4')])
-    return np.loadtxt('./place_data.txt', dtype=dt)
+    return np.loadtxt(PLACE_DATA_F, dtype=dt, ndmin=1)
+
+
+def name_hash(name: str) -> int:
+    return zlib.crc32(name.encode())
+
+
+def build_city_index() -> tuple[npt.NDArray[np.generic], npt.NDArray[np.int32]]:
+    import numpy as np
+    raw = parse_city_data()
+    cities = np.zeros(len(raw), dtype=PLACE_FIELDS)
+    for field in ('place', 'lat', 'long'):
+        cities[field] = raw[field]
+    cities['key'] = np.char.lower(raw['place'])
+    cities = cities[np.argsort(cities['key'], kind='stable')]
+
+    # At most half full, so probe chains stay short
+    size = 1 << max(3, (2 * len(cities)).bit_length())
+    slots = np.full(size, -1, dtype=np.int32)
+    for i, name in enumerate(cities['place'].tolist()):
+        h = name_hash(name) & (size - 1)
+        while slots[h] != -1 and cities['place'][slots[h]] != name:
+            h = (h + 1) & (size - 1)
+        if slots[h] == -1:
+            slots[h] = i
+
+    return cities, slots
+
+
+def save_array(pathname: str, array: npt.NDArray[np.generic]) -> None:
+    import numpy as np
+    tmp = f'{pathname}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as fp:
+        np.save(fp, array)
+    os.replace(tmp, pathname)
+
+
+def load_city_index() -> tuple[npt.NDArray[np.generic], npt.NDArray[np.int32]]:
+    """Memory map the compiled city index, rebuilding it if out of date."""
+    import numpy as np
+    try:
+        source = os.path.getmtime(PLACE_DATA_F)
+        if min(os.path.getmtime(PLACE_INDEX_F), os.path.getmtime(PLACE_HASH_F)) >= source:
+            return np.load(PLACE_INDEX_F, mmap_mode='r'), np.load(PLACE_HASH_F, mmap_mode='r')
+    except OSError:
+        pass
+
+    cities, slots = build_city_index()
+    try:
+        save_array(PLACE_INDEX_F, cities)
+        save_array(PLACE_HASH_F, slots)
+    except OSError:
+        pass  # read-only checkout, use it from memory
+
+    return cities, slots
+
+
+def lookup_city(cities: npt.NDArray[np.generic], slots: npt.NDArray[np.int32],
+                name: str) -> int | None:
+    """Index of the city called exactly `name`, in O(1)."""
+    mask = len(slots) - 1
+    h = name_hash(name) & mask
+    while (i := int(slots[h])) != -1:
+        if cities['place'][i] == name:
+            return i
+        h = (h + 1) & mask
+
+    return None
+
+
+def search_cities(cities: npt.NDArray[np.generic], term: str, limit: int = 10) -> list[str]:
+    """Cities starting with `term`, ignoring case, or else the closest names."""
+    import difflib
+    import numpy as np
+    key = term.lower()[:31]
+    keys = cities['key']
+    lo, hi = np.searchsorted(keys, [key, key + '\U0010ffff'])
+    if lo < hi:
+        return [str(name) for name in cities['place'][lo:min(hi, lo + limit)]]
+
+    close = difflib.get_close_matches(key, keys.tolist(), n=limit, cutoff=0.6)
+    return [str(cities['place'][np.searchsorted(keys, match)]) for match in close]
+
+
+def haversine(lat: npt.NDArray[np.float64] | float, lon: npt.NDArray[np.float64] | float,
+              lats: npt.NDArray[np.float64] | float,
+              lons: npt.NDArray[np.float64] | float) -> npt.NDArray[np.float64]:
+    """Great circle distance in km between broadcast points, in radians."""
+    import numpy as np
+    a = (np.sin((lats - lat) / 2) ** 2
+         + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2)
+    km: npt.NDArray[np.float64] = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+    return km
+
+
+class CityGrid:
+    """Uniform lat/lon grid over the cities for nearest neighbour queries.
+
+    Cells are GRID_CELL degrees of latitude high and about as many km wide.
+    Cities are sorted by cell, row major, so the cells of one grid row in a
+    column range are a single slice.
+
+    Every bucket of GRID_BUCKET by GRID_BUCKET cells gets a candidate list
+    that surely holds the k nearest cities of any point inside it: grow the
+    bucket by rings of cells until it holds k cities, which bounds the k-th
+    distance from anywhere in it, then take the ring that must contain
+    everything within that bound. Queries are grouped by bucket and
+    measured against its candidates in one go.
+    """
+
+    def __init__(self, lat: npt.ArrayLike, lon: npt.ArrayLike,
+                 cell: float = GRID_CELL) -> None:
+        import numpy as np
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        mid = float(np.median(lat)) if len(lat) else 0.0
+        self.cell_lat = cell
+        self.cell_lon = min(cell / max(math.cos(math.radians(mid)), 0.1), 360.0)
+        rows = np.floor(lat / self.cell_lat).astype(np.int64)
+        cols = np.floor(lon / self.cell_lon).astype(np.int64)
+        self.row0 = int(rows.min()) if len(rows) else 0
+        self.col0 = int(cols.min()) if len(cols) else 0
+        self.nrows = int(rows.max()) - self.row0 + 1 if len(rows) else 1
+        self.ncols = int(cols.max()) - self.col0 + 1 if len(cols) else 1
+        cells = (rows - self.row0) * self.ncols + (cols - self.col0)
+
+        self.order = np.argsort(cells, kind='stable')
+        self.starts = np.searchsorted(cells[self.order], np.arange(self.nrows * self.ncols + 1))
+        self.lat = np.radians(lat[self.order])
+        self.lon = np.radians(lon[self.order])
+        self.candidates: dict[tuple[int, int, int], npt.NDArray[np.intp]] = {}
+
+    def _block(self, qr: int, qc: int, r: int) -> npt.NDArray[np.intp]:
+        """Positions in sorted order of the cities within r cells of bucket (qr, qc)."""
+        import numpy as np
+        r0, r1 = max(qr * GRID_BUCKET - r, 0), min((qr + 1) * GRID_BUCKET - 1 + r, self.nrows - 1)
+        c0, c1 = max(qc * GRID_BUCKET - r, 0), min((qc + 1) * GRID_BUCKET - 1 + r, self.ncols - 1)
+        if r0 > r1 or c0 > c1:
+            return np.empty(0, dtype=np.intp)
+        first = np.arange(r0, r1 + 1) * self.ncols
+        lo = self.starts[first + c0]
+        counts = self.starts[first + c1 + 1] - lo
+        # Concatenated ranges lo[i]:lo[i] + counts[i]
+        skip = np.cumsum(counts) - counts
+        block: npt.NDArray[np.intp] = np.arange(int(counts.sum())) + np.repeat(lo - skip, counts)
+        return block
+
+    def _reach_all(self, qr: int, qc: int) -> int:
+        """Smallest r for which _block(qr, qc, r) is every city."""
+        return max(qr * GRID_BUCKET, self.nrows - (qr + 1) * GRID_BUCKET,
+                   qc * GRID_BUCKET, self.ncols - (qc + 1) * GRID_BUCKET, 0)
+
+    def _candidates(self, qr: int, qc: int, k: int) -> npt.NDArray[np.intp]:
+        import numpy as np
+        key = (qr, qc, k)
+        if key in self.candidates:
+            return self.candidates[key]
+
+        everything = self._reach_all(qr, qc)
+        r = 0
+        idx = self._block(qr, qc, r)
+        while len(idx) < k and r < everything:
+            r = min(2 * r + 1, everything)
+            idx = self._block(qr, qc, r)
+
+        if r < everything:
+            size_lat = GRID_BUCKET * self.cell_lat
+            size_lon = GRID_BUCKET * self.cell_lon
+            south = (self.row0 + qr * GRID_BUCKET) * self.cell_lat
+            north = south + size_lat
+            poleward = min(max(abs(south), abs(north)), 90.0)
+            equatorward = 0.0 if south < 0 < north else min(abs(south), abs(north), 90.0)
+            # Any point of the bucket is within `half` of its centre: along
+            # a meridian, then along the parallel where it is widest
+            half = EARTH_RADIUS * math.radians(
+                size_lat / 2 + math.cos(math.radians(equatorward)) * size_lon / 2)
+            centre = haversine(math.radians(south + size_lat / 2),
+                               math.radians(self.col0 * self.cell_lon + (qc + 0.5) * size_lon),
+                               self.lat[idx], self.lon[idx])
+            reach = (float(np.partition(centre, k - 1)[k - 1]) + half) / EARTH_RADIUS
+
+            # So the k nearest are at most this many degrees of latitude
+            # off, at no more than `far` latitude, so this many of longitude
+            dlat = math.degrees(reach)
+            far = min(poleward + dlat, 90.0)
+            cos_both = math.cos(math.radians(poleward)) * math.cos(math.radians(far))
+            sin_half = math.sin(min(reach, math.pi) / 2) / math.sqrt(max(cos_both, 1e-300))
+            dlon = 360.0 if sin_half >= 1 else math.degrees(2 * math.asin(sin_half))
+            need = math.ceil(max(dlat / self.cell_lat, dlon / self.cell_lon))
+            if need > r:
+                idx = self._block(qr, qc, min(need, everything))
+
+        self.candidates[key] = idx
+        return idx
+
+    def nearest(self, lat: npt.ArrayLike, lon: npt.ArrayLike,
+                k: int) -> tuple[npt.NDArray[np.intp], npt.NDArray[np.float64]]:
+        """Indices into the original arrays of the k closest cities of every
+        point, nearest first, and their distance in km. Both are (points, k).
+        """
+        import numpy as np
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+        k = min(k, len(self.order))
+        found = np.empty((len(lat), k), dtype=np.intp)
+        dists = np.empty((len(lat), k), dtype=np.float64)
+
+        qr = (np.floor(lat / self.cell_lat).astype(np.int64) - self.row0) // GRID_BUCKET
+        qc = (np.floor(lon / self.cell_lon).astype(np.int64) - self.col0) // GRID_BUCKET
+        cells, group = np.unique(np.stack([qr, qc], axis=1), axis=0, return_inverse=True)
+        by_cell = np.argsort(group.ravel(), kind='stable')
+        bounds = np.searchsorted(group.ravel()[by_cell], np.arange(len(cells) + 1))
+
+        for c, (r, col) in enumerate(cells.tolist()):
+            points = by_cell[bounds[c]:bounds[c + 1]]
+            idx = self._candidates(r, col, k)
+            dist = haversine(np.radians(lat[points])[:, None], np.radians(lon[points])[:, None],
+                             self.lat[idx][None, :], self.lon[idx][None, :])
+            best = np.argsort(dist, axis=1, kind='stable')[:, :k]
+            found[points] = self.order[idx[best]]
+            dists[points] = np.take_along_axis(dist, best, axis=1)
+
+        return found, dists
+
+
+def arg_parse_coord(val: str) -> tuple[float, float]:
+    try:
+        lat, lon = map(float, val.replace(',', ' ').split())
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'`{val}` is not LAT,LON')
+
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise argparse.ArgumentTypeError(f'`{val}` is out of range')
+
+    return lat, lon
+
+
+def read_coord_file(pathname: str) -> list[tuple[float, float]]:
+    """LAT,LON (or LAT LON) pairs, one per line. `#` starts a comment."""
+    with open(pathname, 'r', encoding='utf-8') as fp:
+        lines = (line.split('#', 1)[0].strip() for line in fp)
+        return [arg_parse_coord(line) for line in lines if line]
+
+
+class Neighbour(TypedDict):
+    lat: float
+    lon: float
+    rank: int
+    place: str
+    place_lat: float
+    place_lon: float
+    km: float
+
+
+def nearest_cities(cities: npt.NDArray[np.generic], coords: list[tuple[float, float]],
+                   k: int) -> list[Neighbour]:
+    import numpy as np
+    city_lat: npt.NDArray[np.float64] = cities['lat'].astype(np.float64)
+    city_lon: npt.NDArray[np.float64] = cities['long'].astype(np.float64)
+    grid = CityGrid(city_lat, city_lon)
+    lat = np.array([lat for lat, _ in coords], dtype=np.float64)
+    lon = np.array([lon for _, lon in coords], dtype=np.float64)
+    idx, dist = grid.nearest(lat, lon, k)
+    # (query, rank) nested lists
+    places: list[list[str]] = cities['place'][idx].tolist()
+    place_lat: list[list[float]] = np.round(city_lat[idx], COORD_DECIMALS).tolist()
+    place_lon: list[list[float]] = np.round(city_lon[idx], COORD_DECIMALS).tolist()
+    km: list[list[float]] = np.round(dist, 3).tolist()
+
+    found = []
+    for q, (qlat, qlon) in enumerate(coords):
+        found += [Neighbour(lat=qlat, lon=qlon, rank=rank + 1, place=places[q][rank],
+                            place_lat=place_lat[q][rank], place_lon=place_lon[q][rank],
+                            km=km[q][rank])
+                  for rank in range(idx.shape[1])]
+
+    return found
+
+
+def print_neighbours(found: list[Neighbour], format: str) -> None:
+    if format == 'json':
+        print(json.dumps(found, indent=2))
+        return None
+
+    width = max([len('place')] + [len(n['place']) for n in found])
+    print(f"{'lat':>8} {'lon':>9} {'k':>2} {'place':<{width}} {'km':>8}")
+    for n in found:
+        print(f"{n['lat']:>8.4f} {n['lon']:>9.4f} {n['rank']:>2} {n['place']:<{width}} {n['km']:>8.1f}")
+
+    return None
+
+
+class Forecast(TypedDict):
+    place: str
+    lat: float
+    lon: float
+    air_temperature: float | None
+
+
+def cache_name(lat: float, lon: float) -> str:
+    """One cache file per coordinate pair, rounded to COORD_DECIMALS."""
+    return f'{lat:.{COORD_DECIMALS}f},{lon:.{COORD_DECIMALS}f}'
+
+
+def get_forecast(session: req.Session, lat: float, lon: float,
+                 met_url: str = MET_URL,
+                 cache: HttpCache | None = None) -> Any:
+    return get_json(met_url.format(lat, lon), HEADERS, session, cache, name=cache_name(lat, lon))
+
+
+def round_coord(lat: float, lon: float) -> tuple[float, float]:
+    return round(float(lat), COORD_DECIMALS), round(float(lon), COORD_DECIMALS)
+
+
+def fetch_responses(places: list[tuple[str, float, float]],
+                    workers: int = FETCH_WORKERS,
+                    met_url: str = MET_URL,
+                    cache: HttpCache | None = None) -> list[Any]:
+    """Forecast of every (name, lat, lon), fetched concurrently.
+
+    Places with the same rounded coordinates are requested once. A failed
+    request gives None for the places it covers.
+    """
+    import requests as req
+    from concurrent.futures import ThreadPoolExecutor
+    coords = [round_coord(lat, lon) for _, lat, lon in places]
+    unique = list(dict.fromkeys(coords))
+
+    def forecast(coord: tuple[float, float]) -> Any:
+        try:
+            return get_forecast(session, *coord, met_url=met_url, cache=cache)
+        except (req.RequestException, ValueError) as err:
+            print(f"ERROR: {coord[0]},{coord[1]}: {err}", file=sys.stderr)
+            return None
+
+    with make_session(workers) as session, \
+         ThreadPoolExecutor(max_workers=max(min(workers, len(unique)), 1)) as pool:
+        responses = dict(zip(unique, pool.map(forecast, unique)))
+
+    return [responses[coord] for coord in coords]
+
+
+def fetch_forecasts(places: list[tuple[str, float, float]],
+                    workers: int = FETCH_WORKERS,
+                    met_url: str = MET_URL,
+                    cache: HttpCache | None = None) -> list[Forecast]:
+    """Current temperature of every (name, lat, lon), see `fetch_responses`."""
+    forecasts = []
+    for (name, lat, lon), json_obj in zip(places, fetch_responses(places, workers, met_url, cache)):
+        temp = None
+        try:
+            if json_obj is not None:
+                temp = float(json_obj['properties']['timeseries'][0]['data']['instant'][
+                    'details']['air_temperature'])
+        except (KeyError, IndexError, TypeError, ValueError) as err:
+            print(f"ERROR: {name}: malformed forecast: {err!r}", file=sys.stderr)
+        lat, lon = round_coord(lat, lon)
+        forecasts.append(Forecast(place=name, lat=lat, lon=lon, air_temperature=temp))
+
+    return forecasts
+
+
+def extract_timeseries(json_obj: Any, variables: tuple[str, ...],
+                       hours: int | None = None) -> tuple[npt.NDArray[np.datetime64],
+                                                          npt.NDArray[np.float64]]:
+    """Times and a (steps, variables) array of the instant forecast.
+
+    Only steps less than `hours` after the first are kept. Variables a step
+    lacks are NaN. Times are parsed in one go and each variable is read
+    straight into its column, no per-step records are built.
+    """
+    import numpy as np
+    series = json_obj['properties']['timeseries']
+    # Times are UTC, numpy would warn about the trailing Z
+    times = np.array([step['time'][:19] for step in series], dtype='datetime64[s]')
+    if hours is not None:
+        cut = np.searchsorted(times, times[0] + np.timedelta64(hours, 'h')) if len(times) else 0
+        times = times[:cut]
+        series = series[:cut]
+
+    details = [step['data']['instant']['details'] for step in series]
+    values = np.empty((len(details), len(variables)), dtype=np.float64)
+    for j, var in enumerate(variables):
+        values[:, j] = np.fromiter((d.get(var, np.nan) for d in details),
+                                   dtype=np.float64, count=len(details))
+
+    return times, values
+
+
+class Summary(TypedDict):
+    place: str
+    var: str
+    start: str
+    end: str
+    steps: int
+    min: float
+    max: float
+    mean: float
+
+
+def summarise(place: str, times: npt.NDArray[np.datetime64], values: npt.NDArray[np.float64],
+              variables: tuple[str, ...]) -> list[Summary]:
+    """min/max/mean of each variable over the horizon, ignoring NaN."""
+    import numpy as np
+    with np.errstate(all='ignore'):
+        mins = np.fmin.reduce(values, axis=0, initial=np.inf)
+        maxs = np.fmax.reduce(values, axis=0, initial=-np.inf)
+        counts = np.count_nonzero(~np.isnan(values), axis=0)
+        means = np.nansum(values, axis=0) / counts
+
+    start = str(times[0]) + 'Z' if len(times) else ''
+    end = str(times[-1]) + 'Z' if len(times) else ''
+    return [Summary(place=place, var=var, start=start, end=end, steps=int(counts[j]),
+                    min=float(mins[j]) if counts[j] else np.nan,
+                    max=float(maxs[j]) if counts[j] else np.nan,
+                    mean=float(means[j]))
+            for j, var in enumerate(variables)]
+
+
+def print_summaries(summaries: list[Summary], format: str) -> None:
+    if format == 'json':
+        # NaN is not JSON
+        print(json.dumps([{k: (None if isinstance(v, float) and math.isnan(v) else v)
+                           for k, v in s.items()} for s in summaries], indent=2))
+        return None
+
+    width = max([len('place')] + [len(s['place']) for s in summaries])
+    var_width = max([len('var')] + [len(s['var']) for s in summaries])
+    print(f"{'place':<{width}} {'var':<{var_width}} {'steps':>5} {'min':>8} {'max':>8} {'mean':>8}")
+    for s in summaries:
+        print(f"{s['place']:<{width}} {s['var']:<{var_width}} {s['steps']:>5} "
+              f"{s['min']:>8.1f} {s['max']:>8.1f} {s['mean']:>8.1f}")
+
+    return None
+
+
+def plot_timeseries(pathname: str, series: list[tuple[str, npt.NDArray[np.datetime64],
+                                                      npt.NDArray[np.float64]]],
+                    variables: tuple[str, ...]) -> None:
+    """Save one panel per variable, one line per place, without a display."""
+    plt = pyplot(pathname)
+
+    fig, axes = plt.subplots(len(variables), 1, sharex=True, squeeze=False,
+                             figsize=(10, 3 * len(variables)))
+    for j, var in enumerate(variables):
+        ax = axes[j][0]
+        for place, times, values in series:
+            ax.plot(times, values[:, j], label=place)
+        ax.set_ylabel(var)
+        ax.grid(True)
+    axes[0][0].legend(loc='upper right')
+    axes[-1][0].set_xlabel('time (UTC)')
+    fig.autofmt_xdate()
+    fig.savefig(pathname, bbox_inches='tight')
+    plt.close(fig)
+
+    return None
+
+
+def read_city_file(pathname: str) -> list[str]:
+    """City names, one per line. Blank lines and `#` comments are skipped."""
+    with open(pathname, 'r', encoding='utf-8') as fp:
+        lines = (line.split('#', 1)[0].strip() for line in fp)
+        return [line for line in lines if line]
+
+
+def print_forecasts(forecasts: list[Forecast], format: str) -> None:
+    if format == 'json':
+        print(json.dumps(forecasts, indent=2))
+        return None
+
+    width = max([len('place')] + [len(f['place']) for f in forecasts])
+    print(f"{'place':<{width}} {'lat':>8} {'lon':>8} {'temp':>6}")
+    for f in forecasts:
+        temp = '-' if f['air_temperature'] is None else f"{f['air_temperature']:.1f}"
+        print(f"{f['place']:<{width}} {f['lat']:>8.4f} {f['lon']:>8.4f} {temp:>6}")
+
+    return None
 
 
 def main() -> None:
@@ -34,41 +557,192 @@ def main() -> None:
                         '--select',
                         metavar='CITY',
                         type=str,
-                        help='select city')
+                        nargs='+',
+                        help='select one or more cities')
+    parser.add_argument('-F',
+                        '--select-file',
+                        metavar='FILE',
+                        type=str,
+                        help='select the cities listed in FILE, one per line')
+    parser.add_argument('-j',
+                        '--workers',
+                        type=int,
+                        default=FETCH_WORKERS,
+                        required=False,
+                        help=f'concurrent requests (default {FETCH_WORKERS})')
+    parser.add_argument('--format',
+                        choices=('table', 'json'),
+                        required=False,
+                        help='output format (default: bare temperature for one city, else table)')
+    parser.add_argument('-n',
+                        '--near',
+                        metavar='LAT,LON',
+                        type=arg_parse_coord,
+                        action='append',
+                        required=False,
+                        help='list the cities closest to a coordinate')
+    parser.add_argument('--near-file',
+                        metavar='FILE',
+                        type=str,
+                        required=False,
+                        help='as --near, for every LAT,LON line of FILE')
+    parser.add_argument('-k',
+                        type=int,
+                        default=5,
+                        required=False,
+                        help='how many cities --near lists (default 5)')
+    parser.add_argument('-H',
+                        '--hours',
+                        metavar='N',
+                        type=int,
+                        required=False,
+                        help='summarise the next N hours of the forecast instead of the current temperature')
+    parser.add_argument('-V',
+                        '--vars',
+                        metavar='VAR',
+                        nargs='+',
+                        choices=FORECAST_VARS,
+                        required=False,
+                        help='variables to summarise (default air_temperature)')
+    parser.add_argument('--plot',
+                        metavar='FILE',
+                        type=str,
+                        required=False,
+                        help='also plot the summarised forecast to FILE')
+    parser.add_argument('--cache-dir',
+                        type=str,
+                        default=CACHE_DIR,
+                        required=False,
+                        help=f'forecast cache directory (default {CACHE_DIR})')
+    parser.add_argument('--no-cache',
+                        action='store_true',
+                        help='always download forecasts, bypassing the cache')
+    parser.add_argument('--cache-stats',
+                        action='store_true',
+                        help='print cache hits and misses to stderr')
+    parser.add_argument('-S',
+                        '--search',
+                        metavar='TERM',
+                        type=str,
+                        help='find cities by prefix or similar name')
 
     args = parser.parse_args()
-    lat = DEFAULT_LAT
-    lon = DEFAULT_LON
 
     if args.list:
-        cities = parse_city_data()
+        cities, _ = load_city_index()
         print(cities['place'])
         return None
 
-    if args.select:
-        cities = parse_city_data()
-        if args.select in cities['place']:
-            id = np.where(cities['place'] == args.select)[0][0]
-            lat = cities['lat'][id]
-            lon = cities['long'][id]
-        else:
-            print("ERROR: city not in list")
-            print(f"You can check available cities with `{sys.argv[0]} -l`")
+    if args.search:
+        cities, _ = load_city_index()
+        matches = search_cities(cities, args.search)
+        if not matches:
+            print("ERROR: no matching city")
             exit(1)
+        print('\n'.join(matches))
+        return None
 
-    url = "https://api.met.no/weatherapi/locationforecast/2.0/compact?lat={}&lon={}".format(lat, lon)
-    res = req.get(url, headers=HEADERS)
+    if args.near or args.near_file:
+        coords = list(args.near or [])
+        if args.near_file:
+            try:
+                coords += read_coord_file(args.near_file)
+            except OSError as err:
+                print(f"ERROR: could not read `{args.near_file}`: {err.strerror}")
+                exit(1)
+            except argparse.ArgumentTypeError as err:
+                print(f"ERROR: {args.near_file}: {err}")
+                exit(1)
+        if args.k < 1:
+            print("ERROR: -k has to be at least 1")
+            exit(1)
+        cities, _ = load_city_index()
+        print_neighbours(nearest_cities(cities, coords, args.k), args.format or 'table')
+        return None
 
-    if res.status_code == 200:
-        json_obj = json.loads(res.text)
+    names = list(args.select or [])
+    if args.select_file:
+        try:
+            names += read_city_file(args.select_file)
+        except OSError as err:
+            print(f"ERROR: could not read `{args.select_file}`: {err.strerror}")
+            exit(1)
 
-        temp = json_obj['properties']['timeseries'][0]['data']['instant'][
-            'details']['air_temperature']
-        print(temp)
+    if names:
+        cities, slots = load_city_index()
+        ids = [lookup_city(cities, slots, name) for name in names]
+        missing = [name for name, id in zip(names, ids) if id is None]
+        if missing:
+            print(f"ERROR: city not in list: {', '.join(missing)}")
+            print(f"You can check available cities with `{sys.argv[0]} -l`")
+            exit(1)
+        places = [(name, float(cities['lat'][id]), float(cities['long'][id]))
+                  for name, id in zip(names, ids) if id is not None]
     else:
-        print("ERORR: invalid response")
+        places = [('default', DEFAULT_LAT, DEFAULT_LON)]
+
+    cache = None
+    if not args.no_cache:
+        try:
+            cache = HttpCache(args.cache_dir)
+        except OSError as err:
+            print(f"WARNING: cache disabled, could not create `{args.cache_dir}`: {err.strerror}",
+                  file=sys.stderr)
+
+    if args.hours is not None or args.vars or args.plot:
+        timeseries(args, places, cache)
+        return None
+
+    forecasts = fetch_forecasts(places, args.workers, cache=cache)
+    if args.cache_stats and cache is not None:
+        print(cache.stats(), file=sys.stderr)
+
+    if args.format is None and len(forecasts) == 1:
+        if forecasts[0]['air_temperature'] is None:
+            print("ERORR: invalid response")
+            exit(1)
+        print(forecasts[0]['air_temperature'])
+        return None
+
+    print_forecasts(forecasts, args.format or 'table')
+    if any(f['air_temperature'] is None for f in forecasts):
+        exit(1)
+
+    return None
+
+
+def timeseries(args: argparse.Namespace, places: list[tuple[str, float, float]],
+               cache: HttpCache | None) -> None:
+    variables = tuple(dict.fromkeys(args.vars or ['air_temperature']))
+    responses = fetch_responses(places, args.workers, cache=cache)
+    if args.cache_stats and cache is not None:
+        print(cache.stats(), file=sys.stderr)
+
+    failed = False
+    summaries: list[Summary] = []
+    series = []
+    for (name, _, _), json_obj in zip(places, responses):
+        if json_obj is None:
+            failed = True
+            continue
+        try:
+            times, values = extract_timeseries(json_obj, variables, args.hours)
+        except (KeyError, IndexError, TypeError, ValueError) as err:
+            print(f"ERROR: {name}: malformed forecast: {err!r}", file=sys.stderr)
+            failed = True
+            continue
+        summaries += summarise(name, times, values, variables)
+        series.append((name, times, values))
+
+    if summaries:
+        print_summaries(summaries, args.format or 'table')
+    if args.plot and series:
+        plot_timeseries(args.plot, series, variables)
+    if failed:
         exit(1)
 
+    return None
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env bash
+
+# Startup regression test. yr is run from shell prompts and status bars, so
+# each path may only import what it uses, within a budget of microseconds
+# summed over the top level imports of `-X importtime`.
+
+LIST_BUDGET=200000     # --list: numpy, no requests
+DEFAULT_BUDGET=230000  # no arguments: requests, no numpy
+
+cd "$(dirname "$0")" || exit 1
+cache=$(mktemp -d)
+trap 'rm -r "$cache"' EXIT
+
+# A fresh cached forecast lets the default path run without network I/O
+python3 - "$cache/yr" <<'EOF'
+import sys, time, main
+cache = main.HttpCache(sys.argv[1])
+lat, lon = main.round_coord(main.DEFAULT_LAT, main.DEFAULT_LON)
+series = [{'data': {'instant': {'details': {'air_temperature': 0.0}}}}]
+cache.store(main.MET_URL.format(lat, lon), {'properties': {'timeseries': series}},
+            {'Expires': time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.gmtime(time.time() + 3600))},
+            name=main.cache_name(lat, lon))
+EOF
+
+status=0
+
+# check NAME BUDGET FORBIDDEN_MODULE ARGS...
+check() {
+    local name=$1 budget=$2 forbidden=$3
+    shift 3
+    local log
+    log=$(XDG_CACHE_HOME=$cache python3 -X importtime main.py "$@" 2>&1 >/dev/null)
+    if grep -q "| *$forbidden\$" <<< "$log"; then
+        echo "FAIL $name: imports $forbidden"
+        status=1
+    fi
+    awk -F'|' -v name="$name" -v budget="$budget" '
+        { gsub(/ /, "", $2) }
+        $3 ~ /^ [^ ]/ { t += $2 }
+        END {
+            print (t > budget ? "FAIL " : "ok   ") name ": " t " us (budget " budget ")"
+            exit t > budget
+        }' <<< "$log" || status=1
+}
+
+check --list "$LIST_BUDGET" requests --list
+check default "$DEFAULT_BUDGET" numpy
+
+# Batch fetches against a stand-in met.no
+python3 -m unittest test_yr.py || status=1
+
+exit $status
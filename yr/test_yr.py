@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""Batch forecast tests against a stand-in met.no on 127.0.0.1."""
+
+import collections
+import json
+import threading
+import time
+import unittest
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+import main
+
+LATENCY = 0.3
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server: 'StubServer'
+
+    def log_message(self, format: str, *args: Any) -> None:
+        return None
+
+    def do_GET(self) -> None:
+        query = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+        coord = (query['lat'], query['lon'])
+        with self.server.lock:
+            self.server.requests[coord] += 1
+        time.sleep(self.server.latency)
+
+        status = self.server.faults.get(coord, 200)
+        data: Any = {}
+        if status == 200:
+            data = {'properties': {'timeseries': [{'time': '2026-10-18T12:00:00Z', 'data': {
+                'instant': {'details': {'air_temperature': float(query['lat'])}}}}]}}
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up on it
+
+        return None
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # All places connect at once; past the default backlog of 5 the kernel
+    # drops the SYN and the client retries a second later
+    request_queue_size = 64
+
+    def __init__(self, latency: float) -> None:
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        # (lat, lon) as sent -> requests, and -> HTTP status to answer with
+        self.requests: collections.Counter[tuple[str, str]] = collections.Counter()
+        self.faults: dict[tuple[str, str], int] = {}
+
+    @property
+    def met_url(self) -> str:
+        return f'http://127.0.0.1:{self.server_port}/?lat={{}}&lon={{}}'
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.server = StubServer(LATENCY)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_fetch_deduplicated(self) -> None:
+        places = [(f'By {i}', 59.0 + i / 10, 10.0 + i / 10) for i in range(6)]
+        # The same places again, and a hair away (well below 4 decimals)
+        places += [(f'{name} igjen', lat, lon) for name, lat, lon in places]
+        places += [(f'{name} nær', lat + 1e-6, lon - 1e-6) for name, lat, lon in places[:6]]
+
+        start = time.perf_counter()
+        forecasts = main.fetch_forecasts(places, met_url=self.server.met_url)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(len(self.server.requests), 6)
+        self.assertEqual(set(self.server.requests.values()), {1})
+        # One round trip at a time would take 6 latencies
+        self.assertLess(elapsed, 2 * LATENCY)
+        self.assertEqual([f['place'] for f in forecasts], [name for name, _, _ in places])
+        for forecast, (_, lat, _) in zip(forecasts, places):
+            self.assertEqual(forecast['air_temperature'], round(lat, main.COORD_DECIMALS))
+
+    def test_fetch_error(self) -> None:
+        places = [(f'By {i}', 59.0 + i / 10, 10.0 + i / 10) for i in range(4)]
+        lat, lon = main.round_coord(*places[1][1:])
+        self.server.faults[(str(lat), str(lon))] = 500
+
+        forecasts = main.fetch_forecasts(places, met_url=self.server.met_url)
+
+        self.assertEqual([f['place'] for f in forecasts], [name for name, _, _ in places])
+        self.assertIsNone(forecasts[1]['air_temperature'])
+        for i in (0, 2, 3):
+            self.assertEqual(forecasts[i]['air_temperature'], round(places[i][1], main.COORD_DECIMALS))
+
+
+if __name__ == '__main__':
+    unittest.main()